@@ -0,0 +1,183 @@
+"""
+End-to-end benchmark of the start and stop workflows.
+
+Runs start_server.start and stop_server.stop against a local
+FakeDigitalOcean for several start/stop cycles, with the scripts' own
+config and phase ordering, so everything they do through the API is
+measured: the droplet, DNS record and volume reconcile passes, and the
+sizes lookup for a new droplet. SSH, the server exit, and the game port
+and DNS readiness checks need a real droplet, so they are stubbed out
+to succeed at once; their phases show up in the report, but take no
+time. Reports the wall clock of each traced phase and the API calls
+made, for the first (cold cache) cycle and the mean of the rest.
+
+Both ways of stopping are measured: deleting the droplet, and standby,
+where it is only powered off and the next start powers it back on.
+
+	python bench_e2e.py [cycles] [latency_ms] [boot_seconds]
+"""
+import collections
+import contextlib
+import io
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+import dns_check
+import server_ping
+import start_server
+import stop_server
+import tracing
+from digitalocean import AsyncDigitalOceanAPI
+from fake_digitalocean import FakeDigitalOcean
+from state_cache import StateCache
+
+
+DOMAIN = "example.com"
+SUBDOMAIN = "mc"
+
+
+
+class _StubSSH:
+
+	def close(self):
+		pass
+
+
+
+def _stub_run_steps(ssh, steps, **kwargs):
+	return [{"step": name, "command": command, "exit_code": 0, "elapsed": 0.0, "stdout": "", "stderr": ""}
+		for name, command in steps]
+
+
+@contextlib.contextmanager
+def stubbed(standby):
+	"""
+	Points the scripts' config at the fake, and stubs out everything
+	that needs a real droplet.
+	"""
+	with contextlib.ExitStack() as stack:
+		for module in (start_server, stop_server):
+			stack.enter_context(mock.patch.multiple(module,
+				domain=DOMAIN,
+				subdomain=SUBDOMAIN,
+				rcon_password=None,
+				connect_ssh=lambda *args, **kwargs: _StubSSH()))
+		stack.enter_context(mock.patch.multiple(start_server,
+			droplet_ssh_keys=[],
+			run_steps=_stub_run_steps))
+		stack.enter_context(mock.patch.multiple(stop_server,
+			standby=standby,
+			stop_process=lambda *args, **kwargs: {"exit_code": 0, "elapsed": 0.0}))
+		stack.enter_context(mock.patch.object(server_ping, "wait_until_ready", lambda *args, **kwargs: None))
+		stack.enter_context(mock.patch.object(dns_check, "wait_for_record", lambda *args, **kwargs: None))
+		yield
+
+
+def run_cycle(fake, cache_path):
+	"""
+	Runs one start and one stop. Returns the tracer and the API calls
+	made, by endpoint.
+	"""
+	fake.reset_calls()
+	tracer = tracing.enable()
+	api = AsyncDigitalOceanAPI("benchmark")
+	api.sync.ROOT_PATH = fake.url
+
+	try:
+		with contextlib.redirect_stdout(io.StringIO()) as output:
+			with tracing.phase("start"):
+				start_server.start(api, cache=StateCache(cache_path))
+			with tracing.phase("stop"):
+				code = stop_server.stop(api, cache=StateCache(cache_path))
+		if code != 0:
+			raise RuntimeError(f"stop_server failed:\n{output.getvalue()}")
+	finally:
+		api.close()
+		tracer.finish()
+		tracing.disable()
+	return tracer, collections.Counter(fake.calls)
+
+
+def phase_times(tracer):
+	"""
+	Flattens the phases of a trace to {"start/droplet": seconds, ...}.
+	"""
+	times = {"total": tracer.root.duration}
+	stack = [(span, span.name) for span in tracer.root.children if span.kind == "phase"]
+	while stack:
+		span, path = stack.pop()
+		times[path] = times.get(path, 0) + span.duration
+		stack.extend((child, f"{path}/{child.name}") for child in span.children if child.kind == "phase")
+	return times
+
+
+def run_mode(cycles, latency, boot_time, standby):
+	with FakeDigitalOcean(latency=latency, boot_time=boot_time, action_time=boot_time / 4) as fake, \
+			tempfile.TemporaryDirectory() as tmp, stubbed(standby):
+		fake.add_volume(start_server.volume_name, start_server.region)
+		fake.add_domain(DOMAIN)
+		fake.add_image(start_server.image_name, start_server.region)
+		cache_path = Path(tmp) / "state.json"
+
+		results = []
+		for i in range(cycles):
+			start = time.perf_counter()
+			results.append(run_cycle(fake, cache_path))
+			print(f"  cycle {i + 1}: {time.perf_counter() - start:.2f}s,"
+				f" {sum(results[-1][1].values())} API calls")
+	return results
+
+
+def mean(values):
+	values = list(values)
+	return statistics.mean(values) if values else float("nan")
+
+
+def report(results):
+	"""
+	Prints the phase times and API calls of the first cycle and the
+	mean of the rest. Returns the mean phase times of the rest.
+	"""
+	cold = phase_times(results[0][0])
+	warm = [phase_times(tracer) for tracer, _ in results[1:]]
+	print(f"\n{'phase':<24} {'cold s':>8} {'warm s':>8}")
+	for path in sorted(set(cold).union(*warm), key=lambda p: (p != "total", p)):
+		print(f"{path:<24} {cold.get(path, 0):>8.2f} {mean(times.get(path, 0) for times in warm):>8.2f}")
+
+	cold_calls = results[0][1]
+	warm_calls = [calls for _, calls in results[1:]]
+	print(f"\n{'API calls':<42} {'cold':>5} {'warm':>6}")
+	for endpoint in sorted(set(cold_calls).union(*warm_calls)):
+		print(f"{endpoint:<42} {cold_calls[endpoint]:>5} {mean(calls[endpoint] for calls in warm_calls):>6.1f}")
+	warm_total = mean(sum(calls.values()) for calls in warm_calls)
+	print(f"{'total':<42} {sum(cold_calls.values()):>5} {warm_total:>6.1f}")
+
+	warm_phases = {path: mean(times.get(path, 0) for times in warm) for path in cold}
+	warm_phases["api calls"] = warm_total
+	return warm_phases
+
+
+def main():
+	cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+	latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.05
+	boot_time = float(sys.argv[3]) if len(sys.argv) > 3 else 2.0
+
+	print(f"{cycles} start/stop cycles, {latency * 1000:.0f} ms latency, {boot_time:.1f}s boot")
+	modes = {}
+	for mode, standby in (("delete", False), ("standby", True)):
+		print(f"\n== {mode}")
+		modes[mode] = report(run_mode(cycles, latency, boot_time, standby))
+
+	# The first cycle creates the droplet either way, so compare the rest
+	print(f"\n== warm cycles\n{'':<12} {'start s':>8} {'stop s':>8} {'total s':>8} {'calls':>6}")
+	for mode, times in modes.items():
+		print(f"{mode:<12} {times['start']:>8.2f} {times['stop']:>8.2f}"
+			f" {times['total']:>8.2f} {times['api calls']:>6.1f}")
+
+
+if __name__ == "__main__":
+	main()
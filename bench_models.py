@@ -0,0 +1,125 @@
+"""
+Benchmark for the response models in models.py.
+
+Uses a droplet payload recorded from the API, copied to make a page of
+droplets, and times json.loads plus reading the status and public IP of
+each droplet, as a polling loop does, with plain dicts against Droplet
+models.
+
+	python bench_models.py [num_droplets]
+"""
+import copy
+import json
+import sys
+import timeit
+
+from models import Droplet
+
+
+# A droplet as returned by GET /v2/droplets/{id}
+RECORDED_DROPLET = {
+	"id": 3164444,
+	"name": "DO-MinecraftServer",
+	"memory": 4096,
+	"vcpus": 2,
+	"disk": 80,
+	"locked": False,
+	"status": "active",
+	"kernel": None,
+	"created_at": "2021-03-10T08:12:14Z",
+	"features": ["monitoring", "ipv6", "private_networking"],
+	"backup_ids": [],
+	"next_backup_window": None,
+	"snapshot_ids": [],
+	"image": {
+		"id": 72067660,
+		"name": "20.04 (LTS) x64",
+		"distribution": "Ubuntu",
+		"slug": "ubuntu-20-04-x64",
+		"public": True,
+		"regions": ["ams2", "ams3", "blr1", "fra1", "lon1", "nyc1", "nyc2", "nyc3", "sfo1", "sfo2", "sfo3", "sgp1", "tor1"],
+		"created_at": "2020-10-20T16:34:30Z",
+		"min_disk_size": 15,
+		"type": "base",
+		"size_gigabytes": 0.52,
+		"description": "Ubuntu 20.04 x86",
+		"tags": [],
+		"status": "available"
+	},
+	"volume_ids": ["506f78a4-e098-11e5-ad9f-000f53306ae1"],
+	"size": {
+		"slug": "s-2vcpu-4gb",
+		"memory": 4096,
+		"vcpus": 2,
+		"disk": 80,
+		"transfer": 4.0,
+		"price_monthly": 20.0,
+		"price_hourly": 0.02976,
+		"regions": ["ams2", "ams3", "blr1", "fra1", "lon1", "nyc1", "nyc2", "nyc3", "sfo1", "sfo2", "sfo3", "sgp1", "tor1"],
+		"available": True,
+		"description": "Basic"
+	},
+	"size_slug": "s-2vcpu-4gb",
+	"networks": {
+		"v4": [
+			{"ip_address": "10.130.0.2", "netmask": "255.255.240.0", "gateway": "10.130.0.1", "type": "private"},
+			{"ip_address": "157.230.10.22", "netmask": "255.255.240.0", "gateway": "157.230.0.1", "type": "public"}
+		],
+		"v6": [
+			{"ip_address": "2604:a880:400:d1::b5c:1001", "netmask": 64, "gateway": "2604:a880:400:d1::1", "type": "public"}
+		]
+	},
+	"region": {
+		"name": "Singapore 1",
+		"slug": "sgp1",
+		"features": ["backups", "ipv6", "metadata", "install_agent", "storage", "image_transfer"],
+		"available": True,
+		"sizes": ["s-1vcpu-1gb", "s-1vcpu-2gb", "s-2vcpu-2gb", "s-2vcpu-4gb", "s-4vcpu-8gb", "s-8vcpu-16gb"]
+	},
+	"tags": ["DO-MinecraftServer"],
+	"vpc_uuid": "760e09ef-dc84-11e8-981e-3cfdfeaae000"
+}
+
+
+def recorded_page(n):
+	droplets = []
+	for i in range(n):
+		droplet = copy.deepcopy(RECORDED_DROPLET)
+		droplet["id"] += i
+		droplet["name"] = f"DO-MinecraftServer-{i}"
+		droplets.append(droplet)
+	return json.dumps({"droplets": droplets})
+
+
+def read_dicts(body):
+	out = []
+	for droplet in json.loads(body)["droplets"]:
+		ip = None
+		for network in droplet["networks"]["v4"]:
+			if network["type"] == "public":
+				ip = network["ip_address"]
+				break
+		out.append((droplet, droplet["status"], ip))
+	return out
+
+
+def read_models(body):
+	out = []
+	for droplet in map(Droplet, json.loads(body)["droplets"]):
+		out.append((droplet, droplet.status, droplet.public_ip))
+	return out
+
+
+def main():
+	n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+	body = recorded_page(n)
+	print(f"{n} droplets, {len(body) / 1024:.1f} KiB of JSON")
+
+	for name, read in (("dicts", read_dicts), ("models", read_models)):
+		runs = 20
+		seconds = min(timeit.repeat(lambda: read(body), number=runs, repeat=5)) / runs
+		print(f"{name:<8} parse {seconds * 1000:>8.3f} ms")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,83 @@
+"""
+Benchmark for the pooled DigitalOceanAPI session.
+
+Starts a local stand-in HTTP server and fires the same GET at it, first
+with a fresh `requests.get` per call (the old behaviour) and then
+through a single DigitalOceanAPI session. Reports requests/sec and
+p50/p99 latency for each.
+
+	python bench_session.py [num_requests]
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from digitalocean import DigitalOceanAPI
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+	# Keep-alive needs HTTP/1.1
+	protocol_version = "HTTP/1.1"
+	disable_nagle_algorithm = True
+
+	def do_GET(self):
+		body = json.dumps({"droplet": {"id": 1, "status": "active"}}).encode()
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+def percentile(samples, pct):
+	samples = sorted(samples)
+	index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+	return samples[index]
+
+
+def run(name, call, n):
+	latencies = []
+	start = time.perf_counter()
+	for _ in range(n):
+		t = time.perf_counter()
+		call()
+		latencies.append(time.perf_counter() - t)
+	total = time.perf_counter() - start
+
+	print(f"{name:<12} {n / total:>10.1f} req/s"
+		f"   p50 {percentile(latencies, 50) * 1000:>7.3f} ms"
+		f"   p99 {percentile(latencies, 99) * 1000:>7.3f} ms")
+
+
+def main():
+	n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+	server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	root = f"http://127.0.0.1:{server.server_address[1]}"
+
+	# Before: a new connection for every request
+	headers = {"Authorization": "Bearer benchmark"}
+	run("per-call",
+		lambda: requests.get(f"{root}/v2/droplets/1", headers=headers).json(),
+		n)
+
+	# After: one pooled keep-alive session
+	api = DigitalOceanAPI("benchmark", rate_limiter=False)
+	api.ROOT_PATH = root
+	run("session", lambda: api.droplets.get(1), n)
+	api.close()
+
+	server.shutdown()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,120 @@
+"""
+Benchmark for streamed decoding of list responses.
+
+Serves synthetic pages of droplets from a local stand-in server, each
+several megabytes, and pages through them with iter_all, first decoding
+whole pages with r.json() and then streaming them (stream=True).
+Reports, for each, the time and peak memory to scan every droplet and
+to find one droplet near the start of the first page.
+
+	python bench_stream.py [pages] [droplets_per_page] [padding_bytes]
+"""
+import copy
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from bench_models import RECORDED_DROPLET
+from digitalocean import DigitalOceanAPI
+
+
+def make_pages(root, pages, per_page, padding):
+	bodies = []
+	for page in range(pages):
+		droplets = []
+		for i in range(per_page):
+			droplet = copy.deepcopy(RECORDED_DROPLET)
+			droplet["id"] = page * per_page + i
+			droplet["name"] = f"droplet-{droplet['id']}"
+			# Stand-in for the larger payloads of busy accounts
+			droplet["tags"] = ["x" * 32] * (padding // 36)
+			droplets.append(droplet)
+
+		links = {}
+		if page + 1 < pages:
+			links = {"pages": {"next": f"{root}/v2/droplets?page={page + 2}&per_page={per_page}"}}
+		bodies.append(json.dumps({
+			"droplets": droplets,
+			"links": links,
+			"meta": {"total": pages * per_page}
+		}).encode())
+	return bodies
+
+
+def serve(pages, per_page, padding):
+	bodies = []
+
+	class StandInHandler(BaseHTTPRequestHandler):
+
+		protocol_version = "HTTP/1.1"
+		disable_nagle_algorithm = True
+
+		def do_GET(self):
+			page = int(parse_qs(urlsplit(self.path).query).get("page", ["1"])[0])
+			body = bodies[page - 1]
+			self.send_response(200)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, *args):
+			pass
+
+	server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+	# Stopping a stream early resets the connection, which is expected
+	server.handle_error = lambda request, client_address: None
+	root = f"http://127.0.0.1:{server.server_address[1]}"
+	bodies.extend(make_pages(root, pages, per_page, padding))
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server, root, bodies
+
+
+def measure(scan):
+	tracemalloc.start()
+	start = time.perf_counter()
+	result = scan()
+	elapsed = time.perf_counter() - start
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return result, elapsed, peak
+
+
+def main():
+	pages = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+	per_page = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+	padding = int(sys.argv[3]) if len(sys.argv) > 3 else 8000
+
+	server, root, bodies = serve(pages, per_page, padding)
+	print(f"{pages} pages of {per_page} droplets,"
+		f" {sum(map(len, bodies)) / len(bodies) / 2 ** 20:.1f} MiB per page")
+
+	api = DigitalOceanAPI("benchmark", rate_limiter=False)
+	api.ROOT_PATH = root
+	target = f"droplet-{per_page // 10}"
+
+	for name, stream in (("r.json()", False), ("stream", True)):
+		# Warm up the connection
+		next(api.droplets.iter_all(stream=stream, per_page=per_page))
+
+		count, scan_time, scan_peak = measure(
+			lambda: sum(1 for _ in api.droplets.iter_all(stream=stream, per_page=per_page)))
+		assert count == pages * per_page
+
+		_, find_time, find_peak = measure(lambda: next(
+			d for d in api.droplets.iter_all(stream=stream, per_page=per_page)
+			if d["name"] == target))
+
+		print(f"{name:<9} scan {scan_time * 1000:>8.1f} ms  peak {scan_peak / 2 ** 20:>6.1f} MiB"
+			f"   find {find_time * 1000:>8.1f} ms  peak {find_peak / 2 ** 20:>6.1f} MiB")
+
+	api.close()
+	server.shutdown()
+
+
+if __name__ == "__main__":
+	main()
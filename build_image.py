@@ -0,0 +1,84 @@
+import os
+import sys
+
+import server_setup
+from digitalocean import DigitalOceanAPI
+from models import Droplet
+from ssh import connect as connect_ssh, run_steps
+
+
+# General config
+region = "sgp1"
+
+# Builder droplet config. The size only affects the build, not the
+# droplets booted from the image later.
+builder_name = "DO-MinecraftServer-builder"
+builder_size = "s-1vcpu-1gb"
+builder_image = "ubuntu-20-04-x64"
+builder_ssh_keys = [os.environ.get("DO_SSH_FINGERPRINT")]
+builder_tags = ["DO-MinecraftServer-builder"]
+
+# Image config. start_server.py boots from the newest image with this name.
+image_name = "DO-MinecraftServer-base"
+swap_size = "4G"
+
+# Volume config
+volume_name = "do-minecraft-server"
+
+
+# Connect to API
+access_token = os.environ.get("DO_ACCESS_TOKEN")
+api = DigitalOceanAPI(access_token)
+
+old_image = api.images.find_by_name(image_name, region=region)
+
+
+# Create a droplet to build the image on
+print("Creating builder Droplet")
+droplet = api.droplets.create(
+	name=builder_name,
+	region=region,
+	size=builder_size,
+	image=builder_image,
+	ssh_keys=builder_ssh_keys,
+	tags=builder_tags)["droplet"]
+droplet = api.droplets.wait_for_droplet(droplet["id"], state="active")
+droplet_ip = Droplet(droplet).public_ip
+print("  Droplet ID:", droplet["id"])
+print("  Droplet IP:", droplet_ip)
+
+
+# Bake in the setup that start_server.py would otherwise do over SSH
+print("\nSetting up image")
+steps = server_setup.image_steps(volume_name, swap_size)
+ssh = connect_ssh(droplet_ip)
+results = run_steps(ssh, steps)
+ssh.close()
+for step in results:
+	status = "ok" if step["exit_code"] == 0 else f"exit code {step['exit_code']}"
+	print(f"  {step['step']}: {status} ({step['elapsed']:.1f}s)")
+
+if len(results) != len(steps) or results[-1]["exit_code"] != 0:
+	print("\nSetup failed. Deleting builder Droplet")
+	api.droplets.delete(droplet["id"])
+	sys.exit(1)
+
+
+# Shut down cleanly and snapshot
+print("\nShutting down builder Droplet")
+api.droplets.action(droplet["id"], "shutdown").wait(timeout=300)
+
+print("Taking snapshot (this can take several minutes)")
+api.droplets.snapshot(droplet["id"], image_name).wait(timeout=1800, max_interval=30)
+print(f"  Snapshot {image_name} created in {api.actions.last_wait_metrics['elapsed']:.0f}s")
+
+
+# Clean up the builder droplet and the image it replaces
+print("\nDeleting builder Droplet")
+api.droplets.delete(droplet["id"])
+
+if old_image is not None:
+	print(f"Deleting previous image ({old_image['id']})")
+	api.images.delete(old_image["id"])
+
+print("\nDone!")
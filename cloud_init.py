@@ -0,0 +1,121 @@
+"""
+Generates cloud-config user_data for DropletAPI.create.
+
+The setup steps from server_setup.py run on first boot instead of over
+SSH, so they happen while we are still doing the API-side work (DNS,
+volume attach). Each pipeline runs in the background alongside the
+others, and logs every step with its exit code to
+/var/log/do-minecraft/<pipeline>.log for checking afterwards.
+"""
+import server_setup
+
+
+LOG_DIR = "/var/log/do-minecraft"
+SCRIPT_DIR = "/opt/do-minecraft"
+
+# Written to each pipeline log once it has finished
+DONE_MARKER = "== done"
+
+
+def _indent(text, spaces):
+	pad = " " * spaces
+	return "\n".join(pad + line if line else line for line in text.split("\n"))
+
+
+def pipeline_script(steps, stop_on_error=True):
+	"""
+	Returns a shell script running `steps` in order, logging the start
+	and exit code of each.
+	"""
+	lines = ["#!/bin/bash", "export HOME=/root"]
+	for name, cmd in steps:
+		lines.append(f"echo \"== {name} start $(date +%s.%N)\"")
+		lines.append(f"( {cmd} ) < /dev/null")
+		lines.append("rc=$?")
+		lines.append(f"echo \"== {name} exit $rc $(date +%s.%N)\"")
+		if stop_on_error:
+			lines.append(f"[ $rc -eq 0 ] || {{ echo \"{DONE_MARKER} $rc\"; exit $rc; }}")
+	lines.append(f"echo '{DONE_MARKER} 0'")
+	return "\n".join(lines) + "\n"
+
+
+def cloud_config(pipelines, stop_on_error=True):
+	"""
+	Returns a cloud-config document that runs each pipeline at boot,
+	concurrently with the others.
+
+	pipelines (required) - dict of name to Array of (name, command)
+		The pipelines to run, as taken by ssh.run_concurrently.
+	"""
+	files = []
+	runcmd = [f"mkdir -p {LOG_DIR}"]
+	for name, steps in pipelines.items():
+		path = f"{SCRIPT_DIR}/{name}.sh"
+		files.append(
+			f"  - path: {path}\n"
+			f"    permissions: '0755'\n"
+			f"    content: |\n"
+			f"{_indent(pipeline_script(steps, stop_on_error), 6)}")
+		runcmd.append(f"{path} > {LOG_DIR}/{name}.log 2>&1 &")
+
+	# Keep cloud-init from finishing before the pipelines do, so
+	# `cloud-init status --wait` covers them.
+	runcmd.append("wait")
+
+	return (
+		"#cloud-config\n"
+		"write_files:\n"
+		+ "".join(files)
+		+ "runcmd:\n"
+		+ "".join(f"  - {_yaml_string(cmd)}\n" for cmd in runcmd))
+
+
+def _yaml_string(text):
+	return "'" + text.replace("'", "''") + "'"
+
+
+def server_user_data(volume_name, swap_size=None, device_timeout=600, start_script=None):
+	"""
+	user_data for a stock droplet that mounts the volume once attached
+	and starts the server, while opening the firewall in parallel.
+
+	volume_name (required) - string
+		The name of the block storage volume to mount.
+
+	swap_size - string, Nullable
+		Size of a swapfile to create, e.g. "4G". No swap if None.
+
+	device_timeout - integer
+	Default: 600
+		Seconds to wait for the volume to be attached.
+
+	start_script - string, Nullable
+		Contents to write to the start script before starting the
+		server, e.g. from jvm_profile.start_script. Left as it is on the
+		volume if None.
+	"""
+	server_steps = server_setup.mount_steps(volume_name, timeout=device_timeout)
+	if swap_size is not None:
+		server_steps += server_setup.swap_steps(swap_size)
+	if start_script is not None:
+		server_steps += server_setup.start_script_steps(start_script)
+	server_steps += server_setup.start_steps()
+
+	return cloud_config({
+		"server": server_steps,
+		"firewall": server_setup.firewall_steps()})
+
+
+def verify_steps(pipelines=("server", "firewall")):
+	"""
+	Steps for checking on the boot-time setup over SSH. Waits for
+	cloud-init to finish and prints each pipeline's log, failing if
+	any pipeline did not finish cleanly.
+	"""
+	return [
+		("cloud-init", "cloud-init status --wait > /dev/null"),
+		*[
+			(name, f"cat {LOG_DIR}/{name}.log && tail -n 1 {LOG_DIR}/{name}.log | grep -qx '{DONE_MARKER} 0'")
+			for name in pipelines
+		],
+	]
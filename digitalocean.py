@@ -1,4 +1,33 @@
+import asyncio
+import copy
+import functools
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
+
+import json_stream
+import ratelimit
+import tracing
+
+
+
+class APIError(Exception):
+	"""
+	An error response where one can not be handed back as a body, such
+	as from a list iterator. `status` is the HTTP status if known, and
+	`body` the decoded error body.
+	"""
+
+	def __init__(self, message, status=None, body=None):
+		super().__init__(message)
+		self.status = status
+		self.body = body
 
 
 
@@ -6,40 +35,188 @@ class DigitalOceanAPI:
 
 	ROOT_PATH = "https://api.digitalocean.com"
 
+	# Largest page size the API accepts
+	MAX_PER_PAGE = 200
+
+	# Connection pool and timeout defaults. Timeouts are given as a
+	# (connect, read) tuple, as accepted by requests.
+	POOL_SIZE = 10
+	TIMEOUT = (5, 30)
+
 	@property
 	def headers(self):
-		return {
-			"Authorization": f"Bearer {self._token}"
-		}
+		return self._headers
 	
 
-	def __init__(self, token):
+	def __init__(self, token, pool_size=None, timeout=None, cache_size=None, cache_ttl=30,
+			rate_limiter=True):
+		"""
+		token (required) - string
+			A DigitalOcean personal access token.
+
+		pool_size - integer
+		Default: POOL_SIZE
+			Number of keep-alive connections to pool.
+
+		timeout - number or (connect, read) tuple
+		Default: TIMEOUT
+			Request timeout in seconds.
+
+		cache_size - integer, Nullable
+			Enables caching of GET responses, keeping at most this many
+			entries. See ResponseCache. No caching if None.
+
+		cache_ttl - number
+		Default: 30
+			Seconds a cached response is used without revalidating.
+
+		rate_limiter - RateLimiter or boolean
+		Default: true
+			Paces requests and retries 429s and 5xx responses. True
+			uses a RateLimiter with DigitalOcean's default limits, and
+			False turns it off.
+		"""
 		self._token = token
+		self._headers = {
+			"Authorization": f"Bearer {self._token}"
+		}
+		self.timeout = timeout if timeout is not None else self.TIMEOUT
+
+		# One keep-alive session for every request, so a start/stop
+		# cycle only pays for the TCP+TLS handshake once.
+		pool_size = pool_size if pool_size is not None else self.POOL_SIZE
+		adapter = HTTPAdapter(
+			pool_connections=pool_size,
+			pool_maxsize=pool_size)
+		self._session = requests.Session()
+		self._session.mount("https://", adapter)
+		self._session.mount("http://", adapter)
+		self._session.headers.update(self._headers)
+
+		self.cache = ResponseCache(cache_size, cache_ttl) if cache_size else None
+
+		if rate_limiter is True:
+			rate_limiter = ratelimit.RateLimiter()
+		self.rate_limiter = rate_limiter or None
 
 		# Register API subsets
+		self.actions = ActionAPI(self)
 		self.volumes = BlockStorageAPI(self)
 		self.domains = DomainAPI(self)
 		self.droplets = DropletAPI(self)
+		self.images = ImageAPI(self)
+		self.sizes = SizeAPI(self)
 
 
-	def _make_get(self, url, params):
-		r = requests.get(
-			url=f"{self.ROOT_PATH}{url}",
-			headers=self.headers, params=params)
-		return r.json()
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+
+	def close(self):
+		"""
+		Closes the underlying session and any pooled connections.
+		"""
+		self._session.close()
+
+
+	def _request(self, method, url, **kwargs):
+		"""
+		Sends a request through the session, waiting on the rate limiter
+		first and retrying 429s and (for idempotent methods) 5xx
+		responses. Mutating calls go ahead of GETs, and GETs ahead of
+		polls, when requests are being throttled. Each request is traced
+		as an "http" span.
+		"""
+		with tracing.span("http", f"{method} {url}") as span:
+			r, retries = self._send(method, url, **kwargs)
+			# Streamed bodies are not read yet, so go by the header
+			size = int(r.headers.get("Content-Length") or 0) if kwargs.get("stream") else len(r.content)
+			span.set(status=r.status_code, retries=retries, bytes=size)
+			return r
+
+
+	def _send(self, method, url, **kwargs):
+		limiter = self.rate_limiter
+		attempt = 0
+		while True:
+			if limiter is not None:
+				limiter.acquire(limiter.default_priority(method))
+
+			r = self._session.request(
+				method, f"{self.ROOT_PATH}{url}",
+				timeout=self.timeout, **kwargs)
+			if limiter is None:
+				return r, attempt
+
+			limiter.update(r.headers)
+			delay = limiter.retry_delay(method, r, attempt)
+			if delay is None:
+				return r, attempt
+			# Give the connection back before retrying. A streamed body
+			# would otherwise hold it until garbage collected.
+			r.close()
+			time.sleep(delay)
+			attempt += 1
+
+
+	def _make_get(self, url, params, use_cache=True):
+		if self.cache is None:
+			return self._request("GET", url, params=params).json()
+
+		key = self.cache.key(url, params)
+		if not use_cache:
+			# Skip the cached copy, but keep it up to date with what we
+			# saw, so later cached reads do not go back in time
+			r = self._request("GET", url, params=params)
+			body = r.json()
+			if r.ok:
+				self.cache.store(key, copy.deepcopy(body),
+					r.headers.get("ETag"), r.headers.get("Last-Modified"))
+			else:
+				self.cache.invalidate(url)
+			return body
+
+		entry = self.cache.lookup(key)
+		if entry is not None and entry["fresh"]:
+			return copy.deepcopy(entry["body"])
+
+		# Revalidate a stale entry instead of downloading it again
+		headers = {}
+		if entry is not None:
+			if entry["etag"] is not None:
+				headers["If-None-Match"] = entry["etag"]
+			if entry["last_modified"] is not None:
+				headers["If-Modified-Since"] = entry["last_modified"]
+
+		r = self._request("GET", url, params=params, headers=headers)
+
+		if r.status_code == 304 and entry is not None:
+			self.cache.revalidated(key)
+			return copy.deepcopy(entry["body"])
+
+		if entry is not None:
+			self.cache.miss()
+
+		body = r.json()
+		if r.ok:
+			self.cache.store(key, copy.deepcopy(body),
+				r.headers.get("ETag"), r.headers.get("Last-Modified"))
+		return body
 
 
 	def _make_post(self, url, payload):
-		r = requests.post(
-			url=f"{self.ROOT_PATH}{url}",
-			headers=self.headers, json=payload)
+		r = self._request("POST", url, json=payload)
+		self._invalidate(url, r)
 		return r.json()
 
 
 	def _make_delete(self, url, params, no_resp_on_success=False):
-		r = requests.delete(
-			url=f"{self.ROOT_PATH}{url}",
-			headers=self.headers, params=params)
+		r = self._request("DELETE", url, params=params)
+		self._invalidate(url, r)
 
 		if no_resp_on_success and r.ok:
 			return None
@@ -47,12 +224,406 @@ class DigitalOceanAPI:
 
 
 	def _make_put(self, url, payload):
-		r = requests.put(
-			url=f"{self.ROOT_PATH}{url}",
-			headers=self.headers, json=payload)
+		r = self._request("PUT", url, json=payload)
+		self._invalidate(url, r)
 		return r.json()
 
 
+	def _invalidate(self, url, r):
+		if self.cache is not None and r.ok:
+			self.cache.invalidate(url)
+
+
+	def _poll(self, fetch, done, description, timeout, metrics, **kwargs):
+		"""
+		Calls `fetch` until `done` is true of its result, sleeping with
+		exponential backoff and jitter in between, and returns the last
+		result. `metrics` is updated in place with the number of polls,
+		elapsed seconds and the last result. Raises TimeoutError once
+		`timeout` seconds or `max_calls` polls are used up, including
+		when the rate limiter would hold a poll past the timeout. The
+		loop is traced as a "poll" span.
+
+		See DropletAPI.wait_for_droplet for the backoff options.
+		"""
+		initial_interval = kwargs.get("initial_interval", 1)
+		max_interval = kwargs.get("max_interval", 10)
+		backoff = kwargs.get("backoff", 1.5)
+		jitter = kwargs.get("jitter", 0.2)
+		max_calls = kwargs.get("max_calls", None)
+
+		start = time.monotonic()
+		deadline = start + timeout
+		interval = initial_interval
+		polls = 0
+
+		with tracing.span("poll", description) as span:
+			while True:
+				if self.rate_limiter is not None:
+					with self.rate_limiter.priority(ratelimit.LOW, deadline=deadline):
+						result = fetch()
+				else:
+					result = fetch()
+				polls += 1
+
+				metrics.update({
+					"polls": polls,
+					"elapsed": time.monotonic() - start,
+					"state": result.get("status")
+				})
+				span.set(polls=polls, state=metrics["state"])
+				if done(result):
+					return result
+
+				if max_calls is not None and polls >= max_calls:
+					raise TimeoutError(f"{description}: gave up after {polls} polls")
+
+				# Sleep for the jittered interval, without overshooting the
+				# deadline.
+				delay = interval * (1 - jitter + 2 * jitter * random.random())
+				remaining = deadline - time.monotonic()
+				if remaining <= 0:
+					raise TimeoutError(f"{description}: timed out after {timeout} seconds")
+				time.sleep(min(delay, remaining))
+				interval = min(interval * backoff, max_interval)
+
+
+	def _iter_pages(self, url, params, key, prefetch=False, stream=False):
+		"""
+		Yields every item under `key` across all pages of a list
+		endpoint, following the `links.pages.next` cursor. Pages are
+		only requested as the items are consumed, so stopping early
+		skips the remaining round trips. With `prefetch`, the next page
+		is fetched in the background while the current one is consumed.
+
+		With `stream`, each page is decoded incrementally as it is read
+		(see json_stream), so only one item is in memory at a time and
+		stopping early also skips the rest of the current page. The
+		next page link comes after the items, so `prefetch` has no
+		effect, and the response cache is not used.
+
+		Raises APIError if a page comes back as an error, rather than
+		ending early as though the list were empty.
+		"""
+		if stream:
+			yield from self._iter_pages_streamed(url, params, key)
+			return
+
+		executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+		pending = None
+		try:
+			resp = self._make_get(url, params)
+			while True:
+				next_url = resp.get("links", {}).get("pages", {}).get("next")
+				if next_url is not None:
+					url, params = self._split_url(next_url)
+					if executor is not None:
+						pending = executor.submit(tracing.bind(self._make_get), url, params)
+
+				if key not in resp:
+					raise APIError(f"Listing {url} failed: {resp.get('message')}", body=resp)
+				yield from resp[key]
+
+				if next_url is None:
+					return
+				if pending is not None:
+					resp, pending = pending.result(), None
+				else:
+					resp = self._make_get(url, params)
+		finally:
+			if executor is not None:
+				if pending is not None:
+					pending.cancel()
+				executor.shutdown(wait=False)
+
+
+	def _iter_pages_streamed(self, url, params, key):
+		while url is not None:
+			r = self._request("GET", url, params=params, stream=True)
+			try:
+				if not r.ok:
+					try:
+						body = r.json()
+					except ValueError:
+						body = {}
+					raise APIError(f"Listing {url} failed with {r.status_code}: {body.get('message')}",
+						status=r.status_code, body=body)
+				chunks = r.iter_content(json_stream.CHUNK_SIZE)
+				rest = yield from json_stream.iter_items(chunks, key)
+
+				# Read to the end so the connection goes back to the pool.
+				# Stopping early closes it instead.
+				for _ in chunks:
+					pass
+			finally:
+				r.close()
+
+			next_url = rest.get("links", {}).get("pages", {}).get("next")
+			url, params = self._split_url(next_url) if next_url is not None else (None, None)
+
+
+	@staticmethod
+	def _split_url(full_url):
+		"""
+		Splits an absolute API URL, as given in pagination links, into
+		the path and params that the _make_* methods expect.
+		"""
+		parts = urlsplit(full_url)
+		return parts.path, dict(parse_qsl(parts.query))
+
+
+
+class ResponseCache:
+	"""
+	LRU cache of GET responses, keyed by path and params.
+
+	Entries are used as-is for `ttl` seconds, then revalidated with a
+	conditional GET (If-None-Match / If-Modified-Since) where the API
+	gave an ETag or Last-Modified header. A successful POST, PUT or
+	DELETE drops every entry under the same collection, and under any
+	collection whose payloads it also changes (attaching a volume
+	changes the droplet's volume_ids, for example).
+
+	Hit rates are kept in `stats`.
+	"""
+
+	# Collections whose payloads change when another one is mutated
+	RELATED = {
+		"droplets": ("volumes",),
+		"volumes": ("droplets",)
+	}
+
+	def __init__(self, max_size, ttl):
+		self.max_size = max_size
+		self.ttl = ttl
+		self.stats = {
+			"hits": 0,
+			"revalidated": 0,
+			"misses": 0,
+			"evictions": 0,
+			"invalidations": 0
+		}
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+
+
+	@property
+	def hit_rate(self):
+		"""
+		Fraction of lookups answered without downloading the body.
+		"""
+		served = self.stats["hits"] + self.stats["revalidated"]
+		total = served + self.stats["misses"]
+		return served / total if total else 0.0
+
+
+	@staticmethod
+	def key(url, params):
+		return url, tuple(sorted((params or {}).items()))
+
+
+	def lookup(self, key):
+		"""
+		Returns the entry for `key` with "fresh" set, or None. A fresh
+		entry counts as a hit and a missing one as a miss. A stale one
+		counts once revalidated, through revalidated() or miss().
+		"""
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				self.stats["misses"] += 1
+				return None
+
+			self._entries.move_to_end(key)
+			entry["fresh"] = time.monotonic() - entry["stored_at"] < self.ttl
+			if entry["fresh"]:
+				self.stats["hits"] += 1
+			elif entry["etag"] is None and entry["last_modified"] is None:
+				# Nothing to revalidate with
+				self.stats["misses"] += 1
+				return None
+			return entry
+
+
+	def miss(self):
+		with self._lock:
+			self.stats["misses"] += 1
+
+
+	def revalidated(self, key):
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None:
+				entry["stored_at"] = time.monotonic()
+			self.stats["revalidated"] += 1
+
+
+	def store(self, key, body, etag, last_modified):
+		with self._lock:
+			self._entries[key] = {
+				"body": body,
+				"etag": etag,
+				"last_modified": last_modified,
+				"stored_at": time.monotonic()
+			}
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.max_size:
+				self._entries.popitem(last=False)
+				self.stats["evictions"] += 1
+
+
+	def invalidate(self, url):
+		"""
+		Drops every entry affected by a mutation of `url`.
+		"""
+		parts = url.split("/")
+		collection = parts[2] if len(parts) > 2 else ""
+		prefixes = tuple(
+			f"/{parts[1]}/{name}"
+			for name in (collection, *self.RELATED.get(collection, ())))
+
+		with self._lock:
+			for key in [key for key in self._entries if key[0].startswith(prefixes)]:
+				del self._entries[key]
+				self.stats["invalidations"] += 1
+
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+
+
+
+class Action:
+	"""
+	Handle for an asynchronous action, as returned by the volume action
+	methods. Indexing it gives the raw response, as before.
+
+	The action can be refreshed or waited on against `/v2/actions/{id}`
+	until it is completed.
+	"""
+
+	def __init__(self, api, response):
+		self._api = api
+		self.response = response
+		self.data = response.get("action")
+
+
+	def __getitem__(self, key):
+		return self.response[key]
+
+
+	def __repr__(self):
+		return f"<Action id={self.id} type={self.type} status={self.status}>"
+
+
+	@property
+	def id(self):
+		return self.data["id"] if self.data else None
+
+
+	@property
+	def type(self):
+		return self.data["type"] if self.data else None
+
+
+	@property
+	def status(self):
+		return self.data["status"] if self.data else None
+
+
+	@property
+	def done(self):
+		return self.status in ("completed", "errored")
+
+
+	def refresh(self):
+		"""
+		Fetches the latest status of the action.
+		"""
+		self._check()
+		self.data = self._api.actions.get(self.id, use_cache=False)["action"]
+		return self
+
+
+	def wait(self, timeout=120, **kwargs):
+		"""
+		Blocks until the action is completed. See
+		ActionAPI.wait_for_action for the options.
+		"""
+		self._check()
+		if not self.done:
+			self.data = self._api.actions.wait_for_action(
+				self.id, timeout=timeout, **kwargs)
+		if self.status == "errored":
+			raise RuntimeError(f"Action {self.id} ({self.type}) errored")
+		return self
+
+
+	def _check(self):
+		if self.data is None:
+			raise RuntimeError(
+				f"Action was not started: {self.response.get('message')}")
+
+
+
+class ActionAPI:
+
+	def __init__(self, api):
+		self._api = api
+		self.last_wait_metrics = None
+
+
+	def get(self, action_id, use_cache=True):
+		"""
+		action_id (required) - integer [>=1]
+			A unique numeric ID that can be used to identify and
+			reference an action.
+
+		use_cache - boolean
+		Default: true
+			Set to false to skip the response cache, e.g. when polling.
+		"""
+		path = f"/v2/actions/{action_id}"
+
+		# Make request
+		return self._api._make_get(path, None, use_cache=use_cache)
+
+
+	def wait_for_action(self, action_id, timeout=120, **kwargs):
+		"""
+		Polls an action until it is completed or errored, and returns
+		the final action payload. Raises TimeoutError if `timeout` or
+		`max_calls` is exceeded.
+
+		Metrics for the most recent wait are kept in
+		`last_wait_metrics` as {"polls", "elapsed", "state"}.
+
+		action_id (required) - integer [>=1]
+			A unique numeric ID that can be used to identify and
+			reference an action.
+
+		timeout - number
+		Default: 120
+			Maximum number of seconds to wait.
+
+		initial_interval - number
+		Default: 0.5
+			Seconds to wait before the second poll.
+
+		See DropletAPI.wait_for_droplet for the other backoff options.
+		"""
+		kwargs.setdefault("initial_interval", 0.5)
+		self.last_wait_metrics = {}
+		return self._api._poll(
+			fetch=lambda: self.get(action_id, use_cache=False)["action"],
+			done=lambda action: action["status"] in ("completed", "errored"),
+			description=f"Action {action_id} completed",
+			timeout=timeout,
+			metrics=self.last_wait_metrics,
+			**kwargs)
+
+
 
 class BlockStorageAPI:
 
@@ -96,6 +667,50 @@ class BlockStorageAPI:
 		return self._api._make_get(path, params)
 
 
+	def iter_all(self, prefetch=False, stream=False, **kwargs):
+		"""
+		Generator over every volume across all pages. Accepts the same
+		filters as list. Pages default to the maximum size of 200.
+
+		prefetch - boolean
+		Default: false
+			Fetch the next page in the background while the current
+			page is being consumed.
+
+		stream - boolean
+		Default: false
+			Decode each page incrementally as it is read, so memory
+			stays flat and stopping early skips the rest of the page.
+		"""
+		path = "/v2/volumes"
+
+		# Required and optional with defaults
+		params = {
+			"per_page": kwargs.get("per_page", self._api.MAX_PER_PAGE)
+		}
+
+		# Optional with no defaults
+		name = kwargs.get("name", None)
+		if name is not None:
+			params.update({"name": name})
+		region = kwargs.get("region", None)
+		if region is not None:
+			params.update({"region": region})
+
+		return self._api._iter_pages(path, params, "volumes", prefetch, stream)
+
+
+	def get(self, volume_id):
+		"""
+		volume_id (required) - string
+			The ID of the block storage volume.
+		"""
+		path = f"/v2/volumes/{volume_id}"
+
+		# Make request
+		return self._api._make_get(path, None)
+
+
 	def action(self, type, volume_id, droplet_id, **kwargs):
 		"""
 		type (required) - string
@@ -133,7 +748,7 @@ class BlockStorageAPI:
 			payload.update({"tags": tags})
 
 		# Make request
-		return self._api._make_post(path, payload)
+		return Action(self._api, self._api._make_post(path, payload))
 
 
 	def attach(self, volume_id, droplet_id, **kwargs):
@@ -188,7 +803,7 @@ class BlockStorageAPI:
 			payload.update({"tags": tags})
 
 		# Make request
-		return self._api._make_post(path, payload)
+		return Action(self._api, self._api._make_post(path, payload))
 
 
 	def attach_by_name(self, volume_name, droplet_id, **kwargs):
@@ -245,6 +860,39 @@ class DomainAPI:
 		return self._api._make_get(path, params)
 
 
+	def iter_records(self, domain_name, prefetch=False, stream=False, **kwargs):
+		"""
+		Generator over every record of a domain across all pages.
+		Accepts the same filters as list_records. Pages default to the
+		maximum size of 200.
+
+		prefetch - boolean
+		Default: false
+			Fetch the next page in the background while the current
+			page is being consumed.
+
+		stream - boolean
+		Default: false
+			Decode each page incrementally as it is read.
+		"""
+		path = f"/v2/domains/{domain_name}/records"
+
+		# Required and optional with defaults
+		params = {
+			"per_page": kwargs.get("per_page", self._api.MAX_PER_PAGE)
+		}
+
+		# Optional with no defaults
+		name = kwargs.get("name", None)
+		if name is not None:
+			params.update({"name": name})
+		type = kwargs.get("type", None)
+		if type is not None:
+			params.update({"type": type})
+
+		return self._api._iter_pages(path, params, "domain_records", prefetch, stream)
+
+
 	def create_record(self, domain_name, type, name, data, **kwargs):
 		"""
 		domain_name (required) - string
@@ -420,7 +1068,130 @@ class DomainAPI:
 		path = f"/v2/domains/{domain_name}/records/{domain_record_id}"
 
 		# Make request
-		return self._api._make_delete(path, None)
+		return self._api._make_delete(path, None, no_resp_on_success=True)
+
+
+	def sync_records(self, domain_name, desired_records, existing=None):
+		"""
+		Makes the records of a domain match `desired_records`, with as
+		few calls as possible. The domain's records are listed once, and
+		for each type and name that appears in `desired_records`, records
+		that already match are left alone, the rest are updated in
+		place, and any left over are created or deleted. Records of
+		other types and names are not touched. The changes are made
+		concurrently.
+
+		domain_name (required) - string
+			The name of the domain itself.
+
+		desired_records (required) - Array of dict
+			The records wanted, with the fields taken by create_record:
+			"type", "name" and "data", and optionally "ttl", "priority",
+			"port", "weight", "flags" and "tag". Names are relative to
+			the domain, with "@" for the domain itself. Optional fields
+			that are left out are not compared.
+
+		existing - Array of dict, Nullable
+			The domain's current records, if they were already listed.
+
+		Returns a dict of the "created", "updated", "deleted" and
+		"unchanged" records, and "errors", a list of (record, response)
+		for calls that failed.
+		"""
+		if existing is None:
+			existing = list(self.iter_records(domain_name))
+
+		wanted_keys = {(record["type"], record["name"]) for record in desired_records}
+		current = {}
+		for record in existing:
+			key = (record["type"], record["name"])
+			if key in wanted_keys:
+				current.setdefault(key, []).append(record)
+
+		result = {"created": [], "updated": [], "deleted": [], "unchanged": [], "errors": []}
+
+		# Keep what already matches, then reuse what is left of the
+		# existing records before creating or deleting any
+		creates, updates, deletes = [], [], []
+		unmatched = {key: list(records) for key, records in current.items()}
+		remaining = []
+		for desired in desired_records:
+			records = unmatched.get((desired["type"], desired["name"]), [])
+			match = next((r for r in records if self._record_matches(domain_name, r, desired)), None)
+			if match is not None:
+				records.remove(match)
+				result["unchanged"].append(match)
+			else:
+				remaining.append(desired)
+		for desired in remaining:
+			records = unmatched.get((desired["type"], desired["name"]), [])
+			if records:
+				updates.append((records.pop(0), desired))
+			else:
+				creates.append(desired)
+		for records in unmatched.values():
+			deletes.extend(records)
+
+		def create(desired):
+			return "created", desired, self.create_record(domain_name, **desired)
+
+		def update(record, desired):
+			return "updated", desired, self.update_record(domain_name, record["id"], **desired)
+
+		def delete(record):
+			return "deleted", record, self.delete_record(domain_name, record["id"])
+
+		calls = ([(create, (desired,)) for desired in creates]
+			+ [(update, change) for change in updates]
+			+ [(delete, (record,)) for record in deletes])
+		if not calls:
+			return result
+
+		with ThreadPoolExecutor(max_workers=min(len(calls), self._api.POOL_SIZE)) as executor:
+			futures = [executor.submit(tracing.bind(call), *args) for call, args in calls]
+			for future in futures:
+				outcome, record, resp = future.result()
+				if outcome == "deleted" and resp is None:
+					result["deleted"].append(record)
+				elif resp is not None and "domain_record" in resp:
+					result[outcome].append(resp["domain_record"])
+				else:
+					result["errors"].append((record, resp))
+
+		return result
+
+
+	@staticmethod
+	def _record_matches(domain_name, record, desired):
+		"""
+		Returns True if an existing record already has every field given
+		in a desired one.
+		"""
+		for field, value in desired.items():
+			if value is None:
+				continue
+			current = record.get(field)
+			if field == "data" and record["type"] in ("CNAME", "MX", "NS", "SRV"):
+				current = DomainAPI._relative_host(domain_name, current)
+				value = DomainAPI._relative_host(domain_name, value)
+			if current != value:
+				return False
+		return True
+
+
+	@staticmethod
+	def _relative_host(domain_name, host):
+		"""
+		Hostnames in record data may be given relative, absolute, or
+		absolute with a trailing dot. Reduces them to the relative form.
+		"""
+		host = (host or "").rstrip(".").lower()
+		if host == domain_name.lower():
+			return "@"
+		suffix = "." + domain_name.lower()
+		if host.endswith(suffix):
+			return host[:-len(suffix)]
+		return host
 
 
 
@@ -428,6 +1199,7 @@ class DropletAPI:
 
 	def __init__(self, api):
 		self._api = api
+		self.last_wait_metrics = None
 
 
 	def list(self, **kwargs):
@@ -460,6 +1232,36 @@ class DropletAPI:
 		return self._api._make_get(path, params)
 
 
+	def iter_all(self, prefetch=False, stream=False, **kwargs):
+		"""
+		Generator over every Droplet across all pages. Accepts the same
+		filters as list. Pages default to the maximum size of 200.
+
+		prefetch - boolean
+		Default: false
+			Fetch the next page in the background while the current
+			page is being consumed.
+
+		stream - boolean
+		Default: false
+			Decode each page incrementally as it is read, so memory
+			stays flat and stopping early skips the rest of the page.
+		"""
+		path = "/v2/droplets"
+
+		# Required and optional with defaults
+		params = {
+			"per_page": kwargs.get("per_page", self._api.MAX_PER_PAGE)
+		}
+
+		# Optional with no defaults
+		tag_name = kwargs.get("tag_name", None)
+		if tag_name is not None:
+			params.update({"tag_name": tag_name})
+
+		return self._api._iter_pages(path, params, "droplets", prefetch, stream)
+
+
 	def create(self, name, region, size, image, **kwargs):
 		"""
 		name (required) - string
@@ -579,15 +1381,70 @@ class DropletAPI:
 		return self._api._make_delete(path, params, no_resp_on_success=True)
 
 
-	def get(self, droplet_id):
+	def get(self, droplet_id, use_cache=True):
 		"""
 		droplet_id (required) - integer [>=1]
 			A unique identifier for a Droplet instance.
+
+		use_cache - boolean
+		Default: true
+			Set to false to skip the response cache, e.g. when polling.
 		"""
 		path = f"/v2/droplets/{droplet_id}"
 
 		# Make request
-		return self._api._make_get(path, None)
+		return self._api._make_get(path, None, use_cache=use_cache)
+
+
+	def wait_for_droplet(self, droplet_id, state="active", timeout=300, **kwargs):
+		"""
+		Polls a Droplet until its status matches `state`, backing off
+		exponentially with jitter between polls. Returns the final
+		Droplet payload, which includes its networks once active.
+		Raises TimeoutError if `timeout` or `max_calls` is exceeded.
+
+		Metrics for the most recent wait are kept in
+		`last_wait_metrics` as {"polls", "elapsed", "state"}.
+
+		droplet_id (required) - integer [>=1]
+			A unique identifier for a Droplet instance.
+
+		state - string ["new", "active", "off", "archive"]
+		Default: "active"
+			The Droplet status to wait for.
+
+		timeout - number
+		Default: 300
+			Maximum number of seconds to wait.
+
+		initial_interval - number
+		Default: 1
+			Seconds to wait before the second poll.
+
+		max_interval - number
+		Default: 10
+			Upper bound on the seconds between polls.
+
+		backoff - number
+		Default: 1.5
+			Multiplier applied to the interval after each poll.
+
+		jitter - number [0 .. 1]
+		Default: 0.2
+			Fraction of each interval that is randomised, so several
+			waiters sharing a token do not poll in lockstep.
+
+		max_calls - integer, Nullable
+			Cap on the number of API calls made while waiting.
+		"""
+		self.last_wait_metrics = {}
+		return self._api._poll(
+			fetch=lambda: self.get(droplet_id, use_cache=False)["droplet"],
+			done=lambda droplet: droplet["status"] == state,
+			description=f"Droplet {droplet_id} {state}",
+			timeout=timeout,
+			metrics=self.last_wait_metrics,
+			**kwargs)
 
 
 	def delete(self, droplet_id):
@@ -601,14 +1458,370 @@ class DropletAPI:
 		return self._api._make_delete(path, None, no_resp_on_success=True)
 
 
+	def action(self, droplet_id, type, **kwargs):
+		"""
+		droplet_id (required) - integer [>=1]
+			A unique identifier for a Droplet instance.
 
-# TODO: API for creating a droplet
+		type (required) - string
+			The type of action to initiate for the Droplet. For
+			example, snapshot, power_on, power_off, shutdown, ...
+
+		name - string
+			The name to give the new snapshot, for snapshot actions.
+		"""
+		path = f"/v2/droplets/{droplet_id}/actions"
 
+		# Required and optional with defaults
+		payload = {
+			"type": type
+		}
 
-# TODO: API for attaching a volume
+		# Optional with no defaults
+		name = kwargs.get("name", None)
+		if name is not None:
+			payload.update({"name": name})
+
+		# Make request
+		return Action(self._api, self._api._make_post(path, payload))
+
+
+	def snapshot(self, droplet_id, name):
+		"""
+		Wrapper for action
+		"""
+		return self.action(droplet_id, "snapshot", name=name)
+
+
+	def power_on(self, droplet_id):
+		"""
+		Wrapper for action
+		"""
+		return self.action(droplet_id, "power_on")
+
+
+	def power_off(self, droplet_id):
+		"""
+		Wrapper for action. Cuts the power, like pulling the plug.
+		"""
+		return self.action(droplet_id, "power_off")
+
+
+	def shutdown(self, droplet_id):
+		"""
+		Wrapper for action. Asks the OS to shut down gracefully.
+		"""
+		return self.action(droplet_id, "shutdown")
+
+
+
+class ImageAPI:
+
+	def __init__(self, api):
+		self._api = api
+
+
+	def list(self, **kwargs):
+		"""
+		type - string ["application", "distribution"]
+			Filters results based on image type.
+
+		private - boolean
+			Used to filter only user images. Snapshots of Droplets are
+			private images.
+
+		tag_name - string
+			Used to filter images by a specific tag.
+
+		per_page - integer [1 .. 200]
+		Default: 20
+			Number of items returned per page
+
+		page - integer [>=1]
+		Default: 1
+			Which 'page' of paginated results to return.
+		"""
+		path = "/v2/images"
+
+		# Required and optional with defaults
+		params = {
+			"per_page": kwargs.get("per_page", 20),
+			"page": kwargs.get("page", 1)
+		}
+
+		# Optional with no defaults
+		type = kwargs.get("type", None)
+		if type is not None:
+			params.update({"type": type})
+		private = kwargs.get("private", None)
+		if private is not None:
+			params.update({"private": "true" if private else "false"})
+		tag_name = kwargs.get("tag_name", None)
+		if tag_name is not None:
+			params.update({"tag_name": tag_name})
+
+		# Make request
+		return self._api._make_get(path, params)
+
+
+	def iter_all(self, prefetch=False, stream=False, **kwargs):
+		"""
+		Generator over every image across all pages. Accepts the same
+		filters as list. Pages default to the maximum size of 200.
+
+		prefetch - boolean
+		Default: false
+			Fetch the next page in the background while the current
+			page is being consumed.
+
+		stream - boolean
+		Default: false
+			Decode each page incrementally as it is read, so memory
+			stays flat and stopping early skips the rest of the page.
+		"""
+		path = "/v2/images"
+
+		# Required and optional with defaults
+		params = {
+			"per_page": kwargs.get("per_page", self._api.MAX_PER_PAGE)
+		}
+
+		# Optional with no defaults
+		type = kwargs.get("type", None)
+		if type is not None:
+			params.update({"type": type})
+		private = kwargs.get("private", None)
+		if private is not None:
+			params.update({"private": "true" if private else "false"})
+		tag_name = kwargs.get("tag_name", None)
+		if tag_name is not None:
+			params.update({"tag_name": tag_name})
 
+		return self._api._iter_pages(path, params, "images", prefetch, stream)
 
-# TODO: API for adding DNS AAAA record
+
+	def find_by_name(self, name, region=None):
+		"""
+		Returns the newest private image called `name`, optionally
+		only if it is available in `region`, or None.
+
+		name (required) - string
+			The display name of the image.
+
+		region - string
+			The slug identifier for the region the image must be
+			available in.
+		"""
+		found = None
+		for image in self.iter_all(private=True):
+			if image["name"] != name:
+				continue
+			if region is not None and region not in image["regions"]:
+				continue
+			if found is None or image["created_at"] > found["created_at"]:
+				found = image
+		return found
+
+
+	def get(self, image_id):
+		"""
+		image_id (required) - integer or string
+			A unique number that can be used to identify and reference
+			a specific image, or the slug of a public image.
+		"""
+		path = f"/v2/images/{image_id}"
+
+		# Make request
+		return self._api._make_get(path, None)
+
+
+	def delete(self, image_id):
+		"""
+		image_id (required) - integer
+			A unique number that can be used to identify and reference
+			a specific image.
+		"""
+		path = f"/v2/images/{image_id}"
+
+		# Make request
+		return self._api._make_delete(path, None, no_resp_on_success=True)
+
+
+
+class SizeAPI:
+
+	def __init__(self, api):
+		self._api = api
+
+
+	def list(self, **kwargs):
+		"""
+		per_page - integer [1 .. 200]
+		Default: 20
+			Number of items returned per page
+
+		page - integer [>=1]
+		Default: 1
+			Which 'page' of paginated results to return.
+		"""
+		path = "/v2/sizes"
+
+		# Required and optional with defaults
+		params = {
+			"per_page": kwargs.get("per_page", 20),
+			"page": kwargs.get("page", 1)
+		}
+
+		# Make request
+		return self._api._make_get(path, params)
+
+
+	def iter_all(self, prefetch=False, stream=False, **kwargs):
+		"""
+		Generator over every Droplet size across all pages. Pages
+		default to the maximum size of 200.
+
+		prefetch - boolean
+		Default: false
+			Fetch the next page in the background while the current
+			page is being consumed.
+
+		stream - boolean
+		Default: false
+			Decode each page incrementally as it is read, so memory
+			stays flat and stopping early skips the rest of the page.
+		"""
+		path = "/v2/sizes"
+
+		# Required and optional with defaults
+		params = {
+			"per_page": kwargs.get("per_page", self._api.MAX_PER_PAGE)
+		}
+
+		return self._api._iter_pages(path, params, "sizes", prefetch, stream)
+
+
+	def find_by_slug(self, slug):
+		"""
+		Returns the size with the given slug, with its "memory" (MiB),
+		"vcpus", "disk" and prices, or None. There is no endpoint for a
+		single size, so this lists them.
+
+		slug (required) - string
+			The slug of the size, e.g. "s-2vcpu-4gb".
+		"""
+		for size in self.iter_all(stream=True):
+			if size["slug"] == slug:
+				return size
+		return None
+
+
+
+class AsyncDigitalOceanAPI:
+	"""
+	Asyncio variant of DigitalOceanAPI. Each sub-API mirrors the sync
+	one method-for-method, but every call returns an awaitable so that
+	independent calls can be run together with `asyncio.gather`.
+
+	The calls are delegated to a wrapped DigitalOceanAPI and run on a
+	thread pool sized to its connection pool, so the parameter building
+	and request handling are shared with the sync client.
+	"""
+
+	def __init__(self, token, pool_size=None, timeout=None, **kwargs):
+		"""
+		Takes the same arguments as DigitalOceanAPI.
+		"""
+		pool_size = pool_size if pool_size is not None else DigitalOceanAPI.POOL_SIZE
+		self.sync = DigitalOceanAPI(token, pool_size=pool_size, timeout=timeout, **kwargs)
+		self._executor = ThreadPoolExecutor(max_workers=pool_size)
+
+		# Register API subsets
+		self.actions = _AsyncSubAPI(self, self.sync.actions)
+		self.volumes = _AsyncSubAPI(self, self.sync.volumes)
+		self.domains = _AsyncSubAPI(self, self.sync.domains)
+		self.droplets = _AsyncSubAPI(self, self.sync.droplets)
+		self.images = _AsyncSubAPI(self, self.sync.images)
+		self.sizes = _AsyncSubAPI(self, self.sync.sizes)
+
+
+	async def __aenter__(self):
+		return self
+
+
+	async def __aexit__(self, *exc_info):
+		self.close()
+
+
+	def close(self):
+		"""
+		Shuts down the worker threads and closes the sync client.
+		"""
+		self._executor.shutdown(wait=False)
+		self.sync.close()
+
+
+	async def wait(self, action, timeout=120, **kwargs):
+		"""
+		Awaitable version of Action.wait.
+		"""
+		return await self._run(action.wait, timeout=timeout, **kwargs)
+
+
+	async def _run(self, func, *args, **kwargs):
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(
+			self._executor, tracing.bind(functools.partial(func, *args, **kwargs)))
+
+
+
+class _AsyncSubAPI:
+	"""
+	Wraps a sync sub-API so each of its methods returns a coroutine.
+	Generator methods (iter_all, iter_records) are exposed as async
+	generators.
+	"""
+
+	_ITERATORS = {"iter_all", "iter_records"}
+
+	def __init__(self, async_api, sync_api):
+		self._async_api = async_api
+		self._sync_api = sync_api
+
+
+	def __getattr__(self, name):
+		method = getattr(self._sync_api, name)
+		if name.startswith("_") or not callable(method):
+			return method
+
+		if name in self._ITERATORS:
+			@functools.wraps(method)
+			async def iterate(*args, **kwargs):
+				it = method(*args, **kwargs)
+				done = object()
+				try:
+					while True:
+						item = await self._async_api._run(next, it, done)
+						if item is done:
+							return
+						yield item
+				finally:
+					# Release a streamed response when stopping early
+					if hasattr(it, "close"):
+						await self._async_api._run(it.close)
+			return iterate
+
+		@functools.wraps(method)
+		async def call(*args, **kwargs):
+			return await self._async_api._run(method, *args, **kwargs)
+		return call
+
+
+
+# TODO: API for creating a droplet
+
+
+# TODO: API for attaching a volume
 
 
 # TODO: API for running something?
@@ -0,0 +1,286 @@
+"""
+DNS propagation check.
+
+Asks a resolver for a record over plain UDP, the same way a player's
+machine would, so we can tell when a changed A record is actually being
+served instead of assuming it is once the API call returns.
+
+	python dns_check.py [name] [expected] [resolver]
+
+Defaults to the DO_SUBDOMAIN.DO_DOMAIN name and the DNS_RESOLVER
+resolver (1.1.1.1 if unset), and prints what it answers. With an
+expected address, waits until that is served.
+"""
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+
+
+DNS_PORT = 53
+DEFAULT_RESOLVER = "1.1.1.1"
+
+TYPES = {"A": 1, "AAAA": 28, "SRV": 33}
+CLASS_IN = 1
+
+# Response codes
+NOERROR = 0
+NXDOMAIN = 3
+
+
+class DNSError(Exception):
+	pass
+
+
+def _encode_name(name):
+	out = b""
+	for label in name.rstrip(".").split("."):
+		label = label.encode("idna")
+		if not 0 < len(label) < 64:
+			raise DNSError(f"Bad name {name!r}")
+		out += bytes([len(label)]) + label
+	return out + b"\x00"
+
+
+def _decode_name(data, offset):
+	"""
+	Reads a possibly compressed name. Returns (name, offset after it).
+	"""
+	labels = []
+	end = None
+	for _ in range(128):
+		if offset >= len(data):
+			raise DNSError("Truncated name")
+		length = data[offset]
+		if length & 0xC0 == 0xC0:
+			# Pointer to a name earlier in the message
+			if end is None:
+				end = offset + 2
+			offset = struct.unpack(">H", data[offset:offset + 2])[0] & 0x3FFF
+			continue
+		offset += 1
+		if length == 0:
+			return ".".join(labels), end if end is not None else offset
+		labels.append(data[offset:offset + length].decode("ascii", "replace"))
+		offset += length
+	raise DNSError("Name compression loop")
+
+
+def _encode_query(query_id, name, type):
+	header = struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 0)
+	return header + _encode_name(name) + struct.pack(">HH", TYPES[type], CLASS_IN)
+
+
+def _decode_rdata(data, offset, length, type_code):
+	if type_code == TYPES["A"]:
+		return socket.inet_ntop(socket.AF_INET, data[offset:offset + length])
+	if type_code == TYPES["AAAA"]:
+		return socket.inet_ntop(socket.AF_INET6, data[offset:offset + length])
+	if type_code == TYPES["SRV"]:
+		priority, weight, port = struct.unpack(">HHH", data[offset:offset + 6])
+		target, _ = _decode_name(data, offset + 6)
+		return {"priority": priority, "weight": weight, "port": port, "target": target}
+	return data[offset:offset + length]
+
+
+def _decode_response(data, query_id, type):
+	if len(data) < 12:
+		raise DNSError("Truncated response")
+	response_id, flags, qdcount, ancount, _, _ = struct.unpack(">HHHHHH", data[:12])
+	if response_id != query_id or not flags & 0x8000:
+		raise DNSError("Response does not match the query")
+	rcode = flags & 0x000F
+	if rcode == NXDOMAIN:
+		return []
+	if rcode != NOERROR:
+		raise DNSError(f"Resolver answered with rcode {rcode}")
+
+	offset = 12
+	for _ in range(qdcount):
+		_, offset = _decode_name(data, offset)
+		offset += 4
+
+	answers = []
+	for _ in range(ancount):
+		_, offset = _decode_name(data, offset)
+		type_code, _, ttl, length = struct.unpack(">HHIH", data[offset:offset + 10])
+		offset += 10
+		# Skip any CNAMEs on the way to the record
+		if type_code == TYPES[type]:
+			answers.append((_decode_rdata(data, offset, length, type_code), ttl))
+		offset += length
+	return answers
+
+
+def query(name, type="A", resolver=DEFAULT_RESOLVER, port=DNS_PORT, timeout=2):
+	"""
+	Asks `resolver` for the `type` records of `name`. Returns a list of
+	(data, ttl), empty if the name does not exist. Data is an address
+	string for A and AAAA records, and a dict of priority, weight, port
+	and target for SRV records.
+
+	Raises DNSError or OSError if the resolver does not answer.
+	"""
+	query_id = random.randrange(1 << 16)
+	family = socket.AF_INET6 if ":" in resolver else socket.AF_INET
+	with socket.socket(family, socket.SOCK_DGRAM) as sock:
+		sock.settimeout(timeout)
+		sock.connect((resolver, port))
+		sock.send(_encode_query(query_id, name, type))
+		deadline = time.monotonic() + timeout
+		while True:
+			sock.settimeout(max(0.001, deadline - time.monotonic()))
+			data = sock.recv(4096)
+			try:
+				return _decode_response(data, query_id, type)
+			except DNSError:
+				# A late answer to an earlier query, keep waiting
+				if data[:2] != struct.pack(">H", query_id):
+					continue
+				raise
+
+
+def wait_for_record(name, expected, type="A", resolver=DEFAULT_RESOLVER, port=DNS_PORT,
+		timeout=600, interval=2, since=None, log=print):
+	"""
+	Polls `resolver` until it serves `expected` for `name`, for use as
+	a readiness gate after changing a record. Returns a dict with:
+
+	waited - number
+		Seconds spent polling.
+
+	latency - number, Nullable
+		Seconds from `since` (a time.time() timestamp of when the
+		record was changed) until it was served. None without `since`.
+
+	polls - integer
+		Number of queries sent.
+
+	ttl - integer
+		The TTL the resolver gave with the answer.
+
+	Raises TimeoutError after `timeout` seconds.
+	"""
+	start = time.monotonic()
+	polls = 0
+	while True:
+		attempt = time.monotonic()
+		polls += 1
+		try:
+			answers = query(name, type, resolver, port, timeout=interval)
+		except (DNSError, OSError):
+			answers = []
+
+		served = [data for data, _ in answers]
+		if expected in served:
+			ttl = next(ttl for data, ttl in answers if data == expected)
+			result = {
+				"waited": time.monotonic() - start,
+				"latency": time.time() - since if since is not None else None,
+				"polls": polls,
+				"ttl": ttl
+			}
+			if log is not None:
+				log(f"  {resolver} serving {name} {type} {expected} after {result['waited']:.1f}s"
+					+ (f" ({result['latency']:.1f}s since the change)" if since is not None else "")
+					+ f", ttl {ttl}")
+			return result
+
+		if attempt - start >= timeout:
+			raise TimeoutError(
+				f"{resolver} still serving {served or 'nothing'} for {name} after {timeout} seconds")
+		time.sleep(max(0, interval - (time.monotonic() - attempt)))
+
+
+
+class StubResolver:
+	"""
+	Local stand-in for a DNS resolver, for trying the propagation check
+	without touching real DNS. Answers A and AAAA queries from
+	`records`, a dict of (name, type) to a list of addresses, which can
+	be changed while it runs. Queries received are counted in
+	`queries`. Runs in a background thread.
+
+	with StubResolver({("mc.example.com", "A"): ["1.2.3.4"]}) as resolver:
+		query("mc.example.com", resolver="127.0.0.1", port=resolver.port)
+	"""
+
+	def __init__(self, records=None, ttl=30):
+		self.records = dict(records or {})
+		self.ttl = ttl
+		self.queries = 0
+
+		self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self._sock.bind(("127.0.0.1", 0))
+		self.port = self._sock.getsockname()[1]
+		threading.Thread(target=self._serve, daemon=True).start()
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+
+	def close(self):
+		self._sock.close()
+
+
+	def _serve(self):
+		while True:
+			try:
+				data, address = self._sock.recvfrom(512)
+			except OSError:
+				return
+			self.queries += 1
+			try:
+				self._sock.sendto(self._answer(data), address)
+			except (DNSError, struct.error):
+				continue
+
+
+	def _answer(self, data):
+		query_id, _, qdcount, _, _, _ = struct.unpack(">HHHHHH", data[:12])
+		name, offset = _decode_name(data, 12)
+		type_code, _ = struct.unpack(">HH", data[offset:offset + 4])
+		question = data[12:offset + 4]
+
+		type = next((t for t, code in TYPES.items() if code == type_code), None)
+		key = next((k for k in self.records if k[0].lower().rstrip(".") == name.lower() and k[1] == type), None)
+		if key is None:
+			return struct.pack(">HHHHHH", query_id, 0x8180 | NXDOMAIN, qdcount, 0, 0, 0) + question
+
+		family = socket.AF_INET6 if type == "AAAA" else socket.AF_INET
+		answers = b""
+		for address in self.records[key]:
+			rdata = socket.inet_pton(family, address)
+			# Name as a pointer to the question
+			answers += struct.pack(">HHHIH", 0xC00C, type_code, CLASS_IN, self.ttl, len(rdata)) + rdata
+		count = len(self.records[key])
+		return struct.pack(">HHHHHH", query_id, 0x8180, qdcount, count, 0, 0) + question + answers
+
+
+
+def main():
+	name = sys.argv[1] if len(sys.argv) > 1 else \
+		f"{os.environ.get('DO_SUBDOMAIN')}.{os.environ.get('DO_DOMAIN')}"
+	expected = sys.argv[2] if len(sys.argv) > 2 else None
+	resolver = sys.argv[3] if len(sys.argv) > 3 else os.environ.get("DNS_RESOLVER", DEFAULT_RESOLVER)
+
+	if expected is None:
+		for type in TYPES:
+			for data, ttl in query(name, type, resolver):
+				print(f"{name} {ttl} {type} {data}")
+		return
+
+	type = "AAAA" if ":" in expected else "A"
+	wait_for_record(name, expected, type=type, resolver=resolver)
+
+
+if __name__ == "__main__":
+	main()
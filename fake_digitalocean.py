@@ -0,0 +1,577 @@
+"""
+In-process stand-in for the DigitalOcean API.
+
+Serves the droplet, volume, domain record, image, size and action endpoints
+that digitalocean.py uses, from memory, so the client and the start and
+stop workflows can be run without an account. Droplets go from "new" to
+"active" after `boot_time` seconds, actions from "in-progress" to
+"completed" after `action_time`, every response is delayed by `latency`
+and carries rate limit headers, and lists are paginated like the real
+API. Runs in a background thread.
+
+with FakeDigitalOcean(latency=0.05) as fake:
+	fake.add_volume("do-minecraft-server", "sgp1")
+	fake.add_domain("example.com")
+	api = DigitalOceanAPI("token")
+	api.ROOT_PATH = fake.url
+
+Calls are counted in `calls`, by method and path with IDs replaced by
+placeholders, e.g. "GET /v2/droplets/{id}".
+"""
+import collections
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+NOT_FOUND = {"id": "not_found", "message": "The resource you were accessing could not be found."}
+
+STOCK_IMAGE = {
+	"id": 72067660,
+	"name": "20.04 (LTS) x64",
+	"distribution": "Ubuntu",
+	"slug": "ubuntu-20-04-x64",
+	"public": True,
+	"type": "base",
+	"status": "available"
+}
+
+# Some basic droplet sizes
+SIZES = [
+	{
+		"slug": slug, "memory": memory, "vcpus": vcpus, "disk": disk, "transfer": memory / 1024,
+		"price_monthly": price, "price_hourly": round(price / 672, 5),
+		"regions": ["nyc1", "sfo3", "ams3", "sgp1", "lon1", "fra1", "tor1", "blr1", "syd1"],
+		"available": True, "description": "Basic"
+	}
+	for slug, memory, vcpus, disk, price in [
+		("s-1vcpu-1gb", 1024, 1, 25, 6),
+		("s-1vcpu-2gb", 2048, 1, 50, 12),
+		("s-2vcpu-2gb", 2048, 2, 60, 18),
+		("s-2vcpu-4gb", 4096, 2, 80, 24),
+		("s-4vcpu-8gb", 8192, 4, 160, 48),
+		("s-8vcpu-16gb", 16384, 8, 320, 96)
+	]
+]
+
+# (pattern, name used in `calls`)
+_ROUTES = [
+	(r"/v2/droplets", "/v2/droplets"),
+	(r"/v2/droplets/(?P<id>\d+)", "/v2/droplets/{id}"),
+	(r"/v2/droplets/(?P<id>\d+)/actions", "/v2/droplets/{id}/actions"),
+	(r"/v2/volumes", "/v2/volumes"),
+	(r"/v2/volumes/actions", "/v2/volumes/actions"),
+	(r"/v2/volumes/(?P<id>[\w-]+)", "/v2/volumes/{id}"),
+	(r"/v2/volumes/(?P<id>[\w-]+)/actions", "/v2/volumes/{id}/actions"),
+	(r"/v2/domains/(?P<domain>[^/]+)/records", "/v2/domains/{domain}/records"),
+	(r"/v2/domains/(?P<domain>[^/]+)/records/(?P<id>\d+)", "/v2/domains/{domain}/records/{id}"),
+	(r"/v2/images", "/v2/images"),
+	(r"/v2/images/(?P<id>\d+)", "/v2/images/{id}"),
+	(r"/v2/sizes", "/v2/sizes"),
+	(r"/v2/actions/(?P<id>\d+)", "/v2/actions/{id}")
+]
+
+
+
+class FakeDigitalOcean:
+
+	def __init__(self, latency=0.0, boot_time=2.0, action_time=1.0, rate_limit=5000):
+		"""
+		latency - number
+		Default: 0
+			Seconds every response is delayed by.
+
+		boot_time - number
+		Default: 2
+			Seconds a new droplet stays "new" before it is "active".
+
+		action_time - number
+		Default: 1
+			Seconds an action stays "in-progress".
+
+		rate_limit - integer
+		Default: 5000
+			Requests allowed per hour before answering 429.
+		"""
+		self.latency = latency
+		self.boot_time = boot_time
+		self.action_time = action_time
+		self.rate_limit = rate_limit
+
+		self.calls = collections.Counter()
+		self.droplets = {}
+		self.volumes = {}
+		self.domains = {}
+		self.images = {}
+		self.actions = {}
+
+		self._ids = iter(range(1000, 10 ** 9))
+		self._remaining = rate_limit
+		self._reset_at = int(time.time()) + 3600
+		self._lock = threading.RLock()
+
+		fake = self
+
+		class Handler(_Handler):
+			api = fake
+
+		self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+		self._server.daemon_threads = True
+		self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+		threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+
+	def close(self):
+		self._server.shutdown()
+		self._server.server_close()
+
+
+	def add_volume(self, name, region, size_gigabytes=10):
+		volume = {
+			"id": str(uuid.uuid4()),
+			"name": name,
+			"region": _region(region),
+			"size_gigabytes": size_gigabytes,
+			"filesystem_type": "ext4",
+			"droplet_ids": [],
+			"created_at": _now()
+		}
+		self.volumes[volume["id"]] = volume
+		return volume
+
+
+	def add_domain(self, name):
+		self.domains.setdefault(name, {})
+
+
+	def add_image(self, name, region):
+		image = {
+			"id": next(self._ids),
+			"name": name,
+			"distribution": "Ubuntu",
+			"slug": None,
+			"public": False,
+			"regions": [region],
+			"type": "snapshot",
+			"status": "available",
+			"created_at": _now()
+		}
+		self.images[image["id"]] = image
+		return image
+
+
+	def reset_calls(self):
+		self.calls.clear()
+
+
+	@property
+	def total_calls(self):
+		return sum(self.calls.values())
+
+
+	def handle(self, method, path, query, body):
+		"""
+		Returns (status, headers, body bytes) for a request.
+		"""
+		with self._lock:
+			status, headers, payload = self._route(method, path, query, body)
+			return status, headers, json.dumps(payload).encode() if payload is not None else b""
+
+
+	def _route(self, method, path, query, body):
+		for pattern, name in _ROUTES:
+			match = re.fullmatch(pattern, path)
+			if match is not None:
+				break
+		else:
+			return 404, {}, NOT_FOUND
+		self.calls[f"{method} {name}"] += 1
+
+		headers = self._rate_limit_headers()
+		if self._remaining < 0:
+			headers["Retry-After"] = str(max(1, self._reset_at - int(time.time())))
+			return 429, headers, {"id": "too_many_requests", "message": "API Rate limit exceeded."}
+
+		self._tick()
+		handler = getattr(self, "_" + method.lower() + re.sub(r"[/{}]+", "_", name).rstrip("_"), None)
+		if handler is None:
+			return 405, headers, {"id": "method_not_allowed", "message": f"{method} not allowed"}
+		status, payload = handler(query, body, **match.groupdict())
+		return status, headers, payload
+
+
+	def _rate_limit_headers(self):
+		now = int(time.time())
+		if now >= self._reset_at:
+			self._remaining = self.rate_limit
+			self._reset_at = now + 3600
+		self._remaining -= 1
+		return {
+			"ratelimit-limit": str(self.rate_limit),
+			"ratelimit-remaining": str(max(0, self._remaining)),
+			"ratelimit-reset": str(self._reset_at)
+		}
+
+
+	def _tick(self):
+		"""
+		Moves droplets and actions along, by how long they have existed.
+		"""
+		now = time.monotonic()
+		for droplet in self.droplets.values():
+			if droplet["status"] == "new" and now - droplet["_created"] >= self.boot_time:
+				droplet["status"] = "active"
+				droplet["networks"] = droplet.pop("_networks")
+		for action in self.actions.values():
+			if action["status"] == "in-progress" and now - action["_started"] >= self.action_time:
+				action["status"] = "completed"
+				action["completed_at"] = _now()
+				action.pop("_apply")()
+
+
+	def _action(self, type, resource_id, resource_type, region, apply):
+		action = {
+			"id": next(self._ids),
+			"status": "in-progress",
+			"type": type,
+			"started_at": _now(),
+			"completed_at": None,
+			"resource_id": resource_id,
+			"resource_type": resource_type,
+			"region_slug": region,
+			"_started": time.monotonic(),
+			"_apply": apply
+		}
+		self.actions[action["id"]] = action
+		return 201, {"action": _public(action)}
+
+
+	def _page(self, path, query, key, items):
+		per_page = min(int(query.get("per_page", 20)), 200)
+		page = int(query.get("page", 1))
+		chunk = items[(page - 1) * per_page:page * per_page]
+
+		pages = {}
+		extra = "".join(f"&{k}={v}" for k, v in query.items() if k not in ("page", "per_page"))
+		if page * per_page < len(items):
+			pages["next"] = f"{self.url}{path}?page={page + 1}&per_page={per_page}{extra}"
+			pages["last"] = f"{self.url}{path}?page={-(-len(items) // per_page)}&per_page={per_page}{extra}"
+		return 200, {
+			key: [_public(item) for item in chunk],
+			"links": {"pages": pages} if pages else {},
+			"meta": {"total": len(items)}
+		}
+
+
+	# Droplets
+
+	def _get_v2_droplets(self, query, body):
+		droplets = list(self.droplets.values())
+		if "tag_name" in query:
+			droplets = [d for d in droplets if query["tag_name"] in d["tags"]]
+		return self._page("/v2/droplets", query, "droplets", droplets)
+
+
+	def _post_v2_droplets(self, query, body):
+		image = body["image"]
+		if isinstance(image, int):
+			if image not in self.images:
+				return 422, {"id": "unprocessable_entity", "message": "You specified an invalid image for Droplet creation."}
+			image = self.images[image]
+		else:
+			image = dict(STOCK_IMAGE, slug=image)
+
+		size = next((size for size in SIZES if size["slug"] == body["size"]), None)
+		if size is None:
+			return 422, {"id": "unprocessable_entity", "message": "You specified an invalid size for Droplet creation."}
+
+		droplet_id = next(self._ids)
+		octet = droplet_id % 250 + 1
+		networks = {"v4": [
+			{"ip_address": f"10.130.0.{octet}", "netmask": "255.255.240.0", "gateway": "10.130.0.1", "type": "private"},
+			{"ip_address": f"203.0.113.{octet}", "netmask": "255.255.255.0", "gateway": "203.0.113.1", "type": "public"}
+		], "v6": []}
+		if body.get("ipv6"):
+			networks["v6"].append({"ip_address": f"2001:db8::{droplet_id:x}", "netmask": 64, "gateway": "2001:db8::1", "type": "public"})
+
+		droplet = {
+			"id": droplet_id,
+			"name": body["name"],
+			"memory": size["memory"],
+			"vcpus": size["vcpus"],
+			"disk": size["disk"],
+			"locked": False,
+			"status": "new",
+			"created_at": _now(),
+			"image": image,
+			"size_slug": body["size"],
+			"region": _region(body["region"]),
+			"networks": {"v4": [], "v6": []},
+			"tags": list(body.get("tags") or []),
+			"volume_ids": [],
+			"_created": time.monotonic(),
+			"_networks": networks
+		}
+		self.droplets[droplet_id] = droplet
+		return 202, {"droplet": _public(droplet)}
+
+
+	def _delete_v2_droplets(self, query, body):
+		for droplet in [d for d in self.droplets.values() if query.get("tag_name") in d["tags"]]:
+			self._delete_droplet(droplet["id"])
+		return 204, None
+
+
+	def _get_v2_droplets_id(self, query, body, id):
+		droplet = self.droplets.get(int(id))
+		if droplet is None:
+			return 404, NOT_FOUND
+		return 200, {"droplet": _public(droplet)}
+
+
+	def _delete_v2_droplets_id(self, query, body, id):
+		if int(id) not in self.droplets:
+			return 404, NOT_FOUND
+		self._delete_droplet(int(id))
+		return 204, None
+
+
+	def _delete_droplet(self, droplet_id):
+		del self.droplets[droplet_id]
+		for volume in self.volumes.values():
+			if droplet_id in volume["droplet_ids"]:
+				volume["droplet_ids"].remove(droplet_id)
+
+
+	def _post_v2_droplets_id_actions(self, query, body, id):
+		droplet = self.droplets.get(int(id))
+		if droplet is None:
+			return 404, NOT_FOUND
+		type = body["type"]
+		if any(a["status"] == "in-progress" and a["resource_type"] == "droplet" and a["resource_id"] == droplet["id"]
+				for a in self.actions.values()):
+			return 422, {"id": "unprocessable_entity", "message": "Droplet already has a pending event."}
+
+		def apply():
+			if type in ("power_off", "shutdown"):
+				droplet["status"] = "off"
+			elif type in ("power_on", "reboot", "power_cycle"):
+				droplet["status"] = "active"
+			elif type == "snapshot":
+				self.add_image(body.get("name") or f"{droplet['name']}-snapshot", droplet["region"]["slug"])
+
+		return self._action(type, droplet["id"], "droplet", droplet["region"]["slug"], apply)
+
+
+	# Volumes
+
+	def _get_v2_volumes(self, query, body):
+		volumes = list(self.volumes.values())
+		if "name" in query:
+			volumes = [v for v in volumes if v["name"] == query["name"]]
+		if "region" in query:
+			volumes = [v for v in volumes if v["region"]["slug"] == query["region"]]
+		return self._page("/v2/volumes", query, "volumes", volumes)
+
+
+	def _get_v2_volumes_id(self, query, body, id):
+		volume = self.volumes.get(id)
+		if volume is None:
+			return 404, NOT_FOUND
+		return 200, {"volume": _public(volume)}
+
+
+	def _post_v2_volumes_actions(self, query, body):
+		volume = next((v for v in self.volumes.values()
+			if v["name"] == body["volume_name"]
+			and v["region"]["slug"] == body.get("region", v["region"]["slug"])), None)
+		if volume is None:
+			return 404, NOT_FOUND
+		return self._volume_action(volume, body)
+
+
+	def _post_v2_volumes_id_actions(self, query, body, id):
+		volume = self.volumes.get(id)
+		if volume is None:
+			return 404, NOT_FOUND
+		return self._volume_action(volume, body)
+
+
+	def _volume_action(self, volume, body):
+		droplet = self.droplets.get(body["droplet_id"])
+		if droplet is None:
+			return 404, NOT_FOUND
+		type = body["type"]
+		if type == "attach" and volume["droplet_ids"] and droplet["id"] not in volume["droplet_ids"]:
+			return 422, {"id": "unprocessable_entity", "message": "Volume is already attached to another Droplet."}
+
+		def apply():
+			if type == "attach":
+				volume["droplet_ids"] = [droplet["id"]]
+				droplet["volume_ids"] = [volume["id"]]
+			elif type == "detach":
+				volume["droplet_ids"] = [i for i in volume["droplet_ids"] if i != droplet["id"]]
+				droplet["volume_ids"] = [i for i in droplet["volume_ids"] if i != volume["id"]]
+
+		return self._action(type + "_volume", volume["id"], "volume", volume["region"]["slug"], apply)
+
+
+	# Domain records
+
+	def _records(self, domain):
+		return self.domains.get(domain)
+
+
+	def _get_v2_domains_domain_records(self, query, body, domain):
+		records = self._records(domain)
+		if records is None:
+			return 404, NOT_FOUND
+		records = list(records.values())
+		if "name" in query:
+			name = query["name"]
+			name = "@" if name == domain else name[:-len(domain) - 1] if name.endswith("." + domain) else name
+			records = [r for r in records if r["name"] == name]
+		if "type" in query:
+			records = [r for r in records if r["type"] == query["type"]]
+		return self._page(f"/v2/domains/{domain}/records", query, "domain_records", records)
+
+
+	def _post_v2_domains_domain_records(self, query, body, domain):
+		records = self._records(domain)
+		if records is None:
+			return 404, NOT_FOUND
+		record = {
+			"id": next(self._ids),
+			"type": body["type"],
+			"name": body["name"],
+			"data": body["data"],
+			"priority": body.get("priority"),
+			"port": body.get("port"),
+			"ttl": body.get("ttl") or 1800,
+			"weight": body.get("weight"),
+			"flags": body.get("flags"),
+			"tag": body.get("tag")
+		}
+		records[record["id"]] = record
+		return 201, {"domain_record": dict(record)}
+
+
+	def _get_v2_domains_domain_records_id(self, query, body, domain, id):
+		record = (self._records(domain) or {}).get(int(id))
+		if record is None:
+			return 404, NOT_FOUND
+		return 200, {"domain_record": dict(record)}
+
+
+	def _put_v2_domains_domain_records_id(self, query, body, domain, id):
+		record = (self._records(domain) or {}).get(int(id))
+		if record is None:
+			return 404, NOT_FOUND
+		record.update({k: v for k, v in body.items() if k in record and k != "id"})
+		return 200, {"domain_record": dict(record)}
+
+
+	def _delete_v2_domains_domain_records_id(self, query, body, domain, id):
+		if (self._records(domain) or {}).pop(int(id), None) is None:
+			return 404, NOT_FOUND
+		return 204, None
+
+
+	# Images
+
+	def _get_v2_images(self, query, body):
+		images = list(self.images.values())
+		if query.get("private") == "true":
+			images = [i for i in images if not i["public"]]
+		if "type" in query:
+			images = [i for i in images if i["type"] == query["type"]]
+		return self._page("/v2/images", query, "images", images)
+
+
+	def _get_v2_images_id(self, query, body, id):
+		image = self.images.get(int(id))
+		if image is None:
+			return 404, NOT_FOUND
+		return 200, {"image": dict(image)}
+
+
+	def _delete_v2_images_id(self, query, body, id):
+		if self.images.pop(int(id), None) is None:
+			return 404, NOT_FOUND
+		return 204, None
+
+
+	# Sizes
+
+	def _get_v2_sizes(self, query, body):
+		return self._page("/v2/sizes", query, "sizes", SIZES)
+
+
+	# Actions
+
+	def _get_v2_actions_id(self, query, body, id):
+		action = self.actions.get(int(id))
+		if action is None:
+			return 404, NOT_FOUND
+		return 200, {"action": _public(action)}
+
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+	protocol_version = "HTTP/1.1"
+	disable_nagle_algorithm = True
+
+	api = None
+
+	def _handle(self):
+		parts = urlsplit(self.path)
+		length = int(self.headers.get("Content-Length") or 0)
+		body = json.loads(self.rfile.read(length)) if length else None
+
+		if self.api.latency:
+			time.sleep(self.api.latency)
+		status, headers, data = self.api.handle(
+			self.command, parts.path, dict(parse_qsl(parts.query)), body)
+
+		self.send_response(status)
+		for name, value in headers.items():
+			self.send_header(name, value)
+		if data:
+			self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+	def log_message(self, *args):
+		pass
+
+
+
+def _now():
+	return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _region(slug):
+	return {"slug": slug, "name": slug, "available": True, "features": ["ipv6", "storage", "metadata"]}
+
+
+def _public(item):
+	"""
+	Copy of a stored object without its private bookkeeping keys.
+	"""
+	return {k: v for k, v in item.items() if not k.startswith("_")}
@@ -0,0 +1,271 @@
+"""
+Idle shutdown watcher.
+
+Keeps an eye on the number of players online and, once the server has
+been empty for the idle window, runs stop_server.py to save the world,
+detach the volume and delete the droplet.
+
+	python idle_watch.py [idle_minutes]
+
+Players are counted with "list" over one RCON connection tunnelled
+through SSH, kept open between checks. Without DO_RCON_PASSWORD, the
+server list ping is used instead. Checks are spread out while players
+are online and get closer together as the idle window runs out. Every
+check and decision is logged with a timestamp.
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from paramiko import SSHException
+
+import server_ping
+from digitalocean import AsyncDigitalOceanAPI
+from rcon import RCON, RCONError
+from reconcile import Reconciler, public_ip
+from ssh import connect as connect_ssh
+from state_cache import StateCache
+
+
+# General config
+region = "sgp1"
+
+# Droplet Config
+droplet_name = "DO-MinecraftServer"
+droplet_tags = ["DO-MinecraftServer"]
+
+# Decisions
+BUSY = "busy"
+IDLE = "idle"
+UNKNOWN = "unknown"
+SHUTDOWN = "shutdown"
+
+STOP_SCRIPT = Path(__file__).with_name("stop_server.py")
+
+
+def log(message):
+	print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}", flush=True)
+
+
+
+class IdleTracker:
+	"""
+	Decides when the server has been idle for long enough, from a
+	series of player counts.
+
+	The idle clock starts at the first check with nobody online, and is
+	reset by any check that sees a player. The server only counts as
+	idle once the window has passed and the last `confirm` checks in a
+	row were all empty, so a single empty answer (a player relogging)
+	can not shut it down. Failed checks neither reset the clock nor
+	count towards confirming it.
+
+	idle_window - number
+	Default: 900
+		Seconds with nobody online before shutting down.
+
+	confirm - integer
+	Default: 3
+		Empty checks in a row needed before shutting down.
+
+	min_interval - number
+	Default: 10
+		Shortest time between checks, used while confirming.
+
+	max_interval - number
+	Default: 120
+		Longest time between checks, used while players are online.
+	"""
+
+	def __init__(self, idle_window=900, confirm=3, min_interval=10, max_interval=120):
+		self.idle_window = idle_window
+		self.confirm = confirm
+		self.min_interval = min_interval
+		self.max_interval = max_interval
+
+		self.idle_since = None
+		self.empty_checks = 0
+		self.failed_checks = 0
+		self.decision = UNKNOWN
+
+
+	def update(self, online, now):
+		"""
+		Records a check at `now` (time.monotonic()) that saw `online`
+		players, or None if the check failed. Returns the decision.
+		"""
+		if online is None:
+			self.failed_checks += 1
+			self.decision = UNKNOWN
+			return self.decision
+		self.failed_checks = 0
+
+		if online > 0:
+			self.idle_since = None
+			self.empty_checks = 0
+			self.decision = BUSY
+			return self.decision
+
+		if self.idle_since is None:
+			self.idle_since = now
+		self.empty_checks += 1
+		if self.idle_for(now) >= self.idle_window and self.empty_checks >= self.confirm:
+			self.decision = SHUTDOWN
+		else:
+			self.decision = IDLE
+		return self.decision
+
+
+	def idle_for(self, now):
+		"""
+		Seconds since the server was last seen with players on it.
+		"""
+		return 0 if self.idle_since is None else now - self.idle_since
+
+
+	def next_interval(self, now):
+		"""
+		Seconds to wait before the next check.
+		"""
+		if self.decision == BUSY:
+			# Nothing can happen for a whole idle window after the last
+			# player leaves, so there is no hurry
+			return self.max_interval
+		if self.decision == UNKNOWN:
+			# Back off while the server is not answering
+			return min(self.max_interval, self.min_interval * 2 ** (self.failed_checks - 1))
+
+		# Check about twice more before the window runs out, then
+		# quickly to confirm it
+		remaining = self.idle_window - self.idle_for(now)
+		return max(self.min_interval, min(self.max_interval, remaining / 2))
+
+
+
+class RCONCounter:
+	"""
+	Counts players with "list" over a single RCON connection, opened
+	with `connect` on first use and reopened if it drops.
+	"""
+
+	def __init__(self, connect):
+		self._connect = connect
+		self._rcon = None
+
+
+	def __call__(self):
+		if self._rcon is None:
+			self._rcon = self._connect()
+		try:
+			return self._rcon.players()["online"]
+		except (RCONError, OSError):
+			self.close()
+			raise
+
+
+	def close(self):
+		if self._rcon is not None:
+			self._rcon.close()
+			self._rcon = None
+
+
+
+def ping_counter(host, port=server_ping.MINECRAFT_PORT):
+	"""
+	Returns a function that counts players with a server list ping.
+	Each check is a new connection, as the server closes it after the
+	status exchange.
+	"""
+	return lambda: server_ping.ping(host, port)["online"]
+
+
+def watch(count, tracker, log=log, sleep=time.sleep, clock=time.monotonic):
+	"""
+	Checks the player count with `count` until `tracker` decides the
+	server is idle. Failed checks are logged and retried.
+	"""
+	while True:
+		try:
+			online = count()
+			error = None
+		except (RCONError, server_ping.PingError, SSHException, OSError) as e:
+			online = None
+			error = e
+
+		now = clock()
+		decision = tracker.update(online, now)
+		if decision == SHUTDOWN:
+			log(f"Nobody online for {tracker.idle_for(now):.0f}s"
+				f" ({tracker.empty_checks} empty checks). Shutting down.")
+			return
+
+		interval = tracker.next_interval(now)
+		if decision == BUSY:
+			log(f"{online} online. Next check in {interval:.0f}s")
+		elif decision == IDLE:
+			log(f"Nobody online for {tracker.idle_for(now):.0f}s of {tracker.idle_window}s."
+				f" Next check in {interval:.0f}s")
+		else:
+			log(f"Could not count players ({error}). Next check in {interval:.0f}s")
+		sleep(interval)
+
+
+def find_droplet_ip(access_token, name, region, tags):
+	"""
+	Returns the IP of the server droplet, or None if there is none, or
+	it is powered off (in standby).
+	"""
+	api = AsyncDigitalOceanAPI(access_token)
+	try:
+		spec = {"droplet": {"name": name, "region": region, "tags": tags}}
+		droplet = asyncio.run(Reconciler(api, spec, cache=StateCache(), log=None).observe())["droplet"]
+	finally:
+		api.close()
+	if droplet is None or droplet["status"] == "off":
+		return None
+	return public_ip(droplet)
+
+
+def main():
+	idle_minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 15
+	rcon_password = os.environ.get("DO_RCON_PASSWORD")
+
+	droplet_ip = find_droplet_ip(
+		os.environ.get("DO_ACCESS_TOKEN"), droplet_name, region, droplet_tags)
+	if droplet_ip is None:
+		log("No running droplet found. Nothing to watch")
+		return
+	log(f"Watching {droplet_ip}, shutting down after {idle_minutes:g} minutes with nobody online")
+
+	ssh = None
+
+	def connect_rcon():
+		# Reconnect SSH too if the tunnel has gone down
+		nonlocal ssh
+		transport = ssh.get_transport() if ssh is not None else None
+		if transport is None or not transport.is_active():
+			if ssh is not None:
+				ssh.close()
+			ssh = connect_ssh(droplet_ip, timeout=30, log=None)
+		return RCON.over_ssh(ssh, rcon_password)
+
+	count = RCONCounter(connect_rcon) if rcon_password else ping_counter(droplet_ip)
+	try:
+		watch(count, IdleTracker(idle_window=idle_minutes * 60))
+	finally:
+		# Let stop_server.py have the RCON port to itself
+		if rcon_password:
+			count.close()
+		if ssh is not None:
+			ssh.close()
+
+	log(f"Running {STOP_SCRIPT.name}")
+	result = subprocess.run([sys.executable, str(STOP_SCRIPT)], cwd=STOP_SCRIPT.parent)
+	log(f"{STOP_SCRIPT.name} exited with {result.returncode}")
+	sys.exit(result.returncode)
+
+
+if __name__ == "__main__":
+	main()
@@ -1,9 +1,14 @@
-...
+import os
+import shlex
 
-SERVER_GB = 3
+import jvm_profile
+from digitalocean import DigitalOceanAPI
 
+...
 
-init_script = f"""
+# Commands to set up the server on a new, empty volume. Filled in by
+# init_script.
+INIT_SCRIPT = """
 ## SETTING UP BLOCK STORAGE ##
 
 # Mount the drive
@@ -42,11 +47,55 @@ chmod +x /mnt/mc/start.sh
 # Edit the EULA
 sed -i 's/false/true/g' /mnt/mc/MinecraftServer/eula.txt
 
-# Edit the start script to start with certain flags!
-echo -e '#!/bin/sh\ncd /mnt/mc/MinecraftServer\n/mnt/mc/jdk/bin/java -Xmx{SERVER_GB}G -jar server.jar --nogui' > /mnt/mc/start.sh
+# Enable RCON, which is only reachable through an SSH tunnel
+sed -i 's/^enable-rcon=.*/enable-rcon=true/' /mnt/mc/MinecraftServer/server.properties
+grep -v '^rcon.password=' /mnt/mc/MinecraftServer/server.properties > /mnt/mc/MinecraftServer/server.properties.new
+printf 'rcon.password=%s\\n' {rcon_password_arg} >> /mnt/mc/MinecraftServer/server.properties.new
+mv /mnt/mc/MinecraftServer/server.properties.new /mnt/mc/MinecraftServer/server.properties
+
+# Edit the start script to start with the launch profile for the droplet
+cat > /mnt/mc/start.sh <<'EOF'
+{start_script}EOF
 """
 
 
+def init_script(volume_name, droplet_size=None, rcon_password=None):
+	"""
+	Returns INIT_SCRIPT for a volume, with the JVM sized to the droplet
+	size as given by the sizes endpoint.
+
+	volume_name (required) - string
+		The name of the volume to set up.
+
+	droplet_size - string
+	Default: DO_DROPLET_SIZE, or "s-2vcpu-4gb"
+		The slug of the droplet size the server will run on.
+
+	rcon_password - string
+	Default: DO_RCON_PASSWORD
+		The password RCON is enabled with. It is written to
+		server.properties as a quoted shell argument, with backslashes
+		escaped for the properties format, so any characters but a
+		newline are safe.
+	"""
+	droplet_size = droplet_size or os.environ.get("DO_DROPLET_SIZE", "s-2vcpu-4gb")
+	rcon_password = rcon_password or os.environ.get("DO_RCON_PASSWORD")
+	if not rcon_password:
+		raise ValueError("DO_RCON_PASSWORD is not set")
+	if "\n" in rcon_password:
+		raise ValueError("The RCON password can not contain a newline")
+
+	with DigitalOceanAPI(os.environ.get("DO_ACCESS_TOKEN")) as api:
+		size = api.sizes.find_by_slug(droplet_size)
+	if size is None:
+		raise LookupError(f"Droplet size {droplet_size} not found")
+
+	return INIT_SCRIPT.format(
+		volume_name=volume_name,
+		rcon_password_arg=shlex.quote(rcon_password.replace("\\", "\\\\")),
+		start_script=jvm_profile.for_size(size))
+
+
 
 
 
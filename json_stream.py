@@ -0,0 +1,140 @@
+"""
+Incremental decoding of list responses.
+
+The list endpoints answer with one JSON object holding a (possibly
+large) array of items, followed by `links` and `meta`:
+
+	{"droplets": [{...}, {...}, ...], "links": {...}, "meta": {...}}
+
+iter_items reads that object from a stream of byte chunks, such as
+`Response.iter_content`, and yields the items of the array one at a
+time, so only one item is held in memory at once and the caller can
+stop reading as soon as it finds what it wants. Every other top-level
+key is decoded as normal and returned once the object is complete.
+"""
+import codecs
+import json
+
+
+# Bytes read from the response at a time
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = "0123456789.eE+-"
+
+
+
+class _Reader:
+	"""
+	Text buffer over an iterator of byte chunks, refilled on demand.
+	"""
+
+	def __init__(self, chunks):
+		self._chunks = iter(chunks)
+		self._decoder = codecs.getincrementaldecoder("utf-8")()
+		self.buffer = ""
+		self.pos = 0
+		self.eof = False
+
+
+	def fill(self):
+		"""
+		Reads another chunk into the buffer, dropping what has already
+		been consumed. Returns False at the end of the stream.
+		"""
+		if self.eof:
+			return False
+		self.buffer = self.buffer[self.pos:]
+		self.pos = 0
+		for chunk in self._chunks:
+			if chunk:
+				self.buffer += self._decoder.decode(chunk)
+				return True
+		self.buffer += self._decoder.decode(b"", final=True)
+		self.eof = True
+		return True
+
+
+	def peek(self):
+		"""
+		Skips whitespace and returns the next character, or "" at the
+		end of the stream.
+		"""
+		while True:
+			while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+				self.pos += 1
+			if self.pos < len(self.buffer):
+				return self.buffer[self.pos]
+			if not self.fill():
+				return ""
+
+
+	def expect(self, chars):
+		char = self.peek()
+		if char == "" or char not in chars:
+			raise json.JSONDecodeError(f"Expecting one of {chars!r}", self.buffer, self.pos)
+		self.pos += 1
+		return char
+
+
+	def value(self, decoder):
+		"""
+		Decodes the next JSON value, reading more of the stream until
+		it is complete.
+		"""
+		self.peek()
+		while True:
+			try:
+				value, end = decoder.raw_decode(self.buffer, self.pos)
+			except json.JSONDecodeError:
+				if not self.fill():
+					raise
+				continue
+
+			# A number cut off at the end of the buffer still decodes
+			# (as 12 from "12" of "123", or 1 from "1e" of "1e-5"), so
+			# only trust a value once something other than part of a
+			# number follows it.
+			if self.eof or (end < len(self.buffer) and self.buffer[end] not in _NUMBER_CHARS):
+				self.pos = end
+				return value
+			self.fill()
+
+
+
+def iter_items(chunks, key):
+	"""
+	Generator over the items of the array under `key` in a JSON object
+	read from `chunks`. Returns (as the generator's return value) a dict
+	of the object's other keys, which is only complete if the array
+	came before them, as it does in API responses.
+
+	Raises json.JSONDecodeError if the stream is not a JSON object or
+	`key` is not an array.
+	"""
+	reader = _Reader(chunks)
+	decoder = json.JSONDecoder()
+	rest = {}
+
+	reader.expect("{")
+	if reader.peek() == "}":
+		return rest
+
+	while True:
+		name = reader.value(decoder)
+		reader.expect(":")
+
+		if name == key:
+			reader.expect("[")
+			if reader.peek() == "]":
+				reader.pos += 1
+			else:
+				while True:
+					yield reader.value(decoder)
+					if reader.expect(",]") == "]":
+						break
+		else:
+			rest[name] = reader.value(decoder)
+
+		if reader.expect(",}") == "}":
+			return rest
@@ -0,0 +1,142 @@
+"""
+JVM launch profile for the Minecraft server, sized to the droplet.
+
+The heap is given most of the droplet's memory, fixed in size (-Xms
+equal to -Xmx) and touched up front, so the server never stalls to
+grow it or to fault in pages mid-game. G1 is tuned the way Minecraft
+servers are commonly run: a large young generation, as almost
+everything a tick allocates dies young, collected often and briefly,
+with mixed collections starting early so old garbage never builds up
+into a long pause.
+
+	python jvm_profile.py [size_slug]
+
+Looks the size up in the sizes endpoint (DO_DROPLET_SIZE if not
+given), and prints the start script it gets.
+"""
+import os
+import sys
+
+import server_setup
+from digitalocean import DigitalOceanAPI
+
+
+SERVER_DIR = f"{server_setup.MOUNT_POINT}/MinecraftServer"
+SERVER_JAR = "server.jar"
+
+# Memory kept back from the heap for the OS and the JVM's own
+# off-heap use (metaspace, code cache, thread stacks, GC structures),
+# as a fraction of the droplet's memory with a floor, in MiB.
+RESERVED_FRACTION = 0.25
+MIN_RESERVED = 768
+MIN_HEAP = 512
+
+# Above this heap size (MiB), the settings for large heaps are used
+LARGE_HEAP = 12 * 1024
+
+
+def heap_size(memory):
+	"""
+	Returns the heap size in MiB for a droplet with `memory` MiB, in
+	whole 256 MiB steps.
+	"""
+	reserved = max(MIN_RESERVED, memory * RESERVED_FRACTION)
+	heap = int(memory - reserved) // 256 * 256
+	return max(MIN_HEAP, heap)
+
+
+def jvm_flags(memory, vcpus, pause_target=200):
+	"""
+	Returns the JVM options for a droplet with `memory` MiB and `vcpus`
+	CPUs.
+
+	memory (required) - integer
+		The droplet's memory in MiB, as "memory" in the sizes endpoint.
+
+	vcpus (required) - integer
+		The droplet's number of CPUs.
+
+	pause_target - integer
+	Default: 200
+		G1's pause time goal in milliseconds. G1 shrinks the young
+		generation to meet it, so a much lower goal means more frequent
+		collections rather than shorter ones.
+	"""
+	heap = heap_size(memory)
+	large = heap >= LARGE_HEAP
+	return [
+		# Fixed heap, faulted in at startup. Transparent huge pages
+		# cut TLB misses without reserving hugepages on the droplet.
+		f"-Xms{heap}M",
+		f"-Xmx{heap}M",
+		"-XX:+AlwaysPreTouch",
+		"-XX:+UseTransparentHugePages",
+
+		# G1, with a young generation of 30-40% of the heap (40-50% for
+		# large heaps) and early, short mixed collections
+		"-XX:+UseG1GC",
+		f"-XX:MaxGCPauseMillis={pause_target}",
+		"-XX:+UnlockExperimentalVMOptions",
+		f"-XX:G1NewSizePercent={40 if large else 30}",
+		f"-XX:G1MaxNewSizePercent={50 if large else 40}",
+		f"-XX:G1HeapRegionSize={16 if large else 8}M",
+		f"-XX:G1ReservePercent={15 if large else 20}",
+		"-XX:G1HeapWastePercent=5",
+		"-XX:G1MixedGCCountTarget=4",
+		f"-XX:InitiatingHeapOccupancyPercent={20 if large else 15}",
+		"-XX:G1MixedGCLiveThresholdPercent=90",
+		"-XX:G1RSetUpdatingPauseTimePercent=5",
+		"-XX:SurvivorRatio=32",
+		"-XX:MaxTenuringThreshold=1",
+		"-XX:+ParallelRefProcEnabled",
+
+		# One GC thread per CPU while paused, and a quarter of them
+		# alongside the game
+		f"-XX:ParallelGCThreads={vcpus}",
+		f"-XX:ConcGCThreads={max(1, vcpus // 4)}",
+
+		# Plugins calling System.gc() would cause full pauses, and the
+		# shared perf memory file causes stalls on a busy disk
+		"-XX:+DisableExplicitGC",
+		"-XX:+PerfDisableSharedMem",
+	]
+
+
+def start_script(memory, vcpus, **kwargs):
+	"""
+	Returns the contents of start.sh for a droplet with `memory` MiB
+	and `vcpus` CPUs. Takes the same options as jvm_flags.
+	"""
+	flags = " \\\n\t".join(jvm_flags(memory, vcpus, **kwargs))
+	return (
+		"#!/bin/sh\n"
+		f"cd {SERVER_DIR}\n"
+		f"exec {server_setup.JAVA} \\\n"
+		f"\t{flags} \\\n"
+		f"\t-jar {SERVER_JAR} --nogui\n")
+
+
+def for_size(size, **kwargs):
+	"""
+	start_script for a size from the sizes endpoint, or a droplet, as
+	both give its "memory" and "vcpus".
+	"""
+	return start_script(size["memory"], size["vcpus"], **kwargs)
+
+
+def main():
+	slug = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("DO_DROPLET_SIZE", "s-2vcpu-4gb")
+
+	with DigitalOceanAPI(os.environ.get("DO_ACCESS_TOKEN")) as api:
+		size = api.sizes.find_by_slug(slug)
+	if size is None:
+		print(f"Unknown size {slug}")
+		sys.exit(1)
+
+	print(f"# {slug}: {size['memory']} MiB, {size['vcpus']} vCPUs,"
+		f" {heap_size(size['memory'])} MiB heap")
+	print(for_size(size), end="")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,73 @@
+"""
+Lightweight response models.
+
+A model wraps one object from an API response. Building one only keeps
+a reference to the raw dict, and fields are looked up as they are
+read, so a polling loop that reads `status` never touches the rest.
+Fields worked out from nested values (the public addresses) are only
+worked out on first read, and kept in a slot.
+
+droplet = Droplet(api.droplets.get(droplet_id)["droplet"])
+droplet.status, droplet.public_ip
+"""
+
+# Marks a field that has not been worked out yet
+_UNSET = object()
+
+
+
+class Droplet:
+
+	__slots__ = ("_data", "_public_ip", "_public_ipv6")
+
+	def __init__(self, data):
+		self._data = data
+		self._public_ip = _UNSET
+		self._public_ipv6 = _UNSET
+
+
+	def __repr__(self):
+		return f"<Droplet id={self.id!r} name={self.name!r} status={self.status!r}>"
+
+
+	@property
+	def id(self):
+		return self._data["id"]
+
+
+	@property
+	def name(self):
+		return self._data["name"]
+
+
+	@property
+	def status(self):
+		return self._data["status"]
+
+
+	@property
+	def public_ip(self):
+		"""
+		The droplet's public IPv4 address, or None before it has one.
+		"""
+		if self._public_ip is _UNSET:
+			self._public_ip = _public_address(self._data, "v4")
+		return self._public_ip
+
+
+	@property
+	def public_ipv6(self):
+		"""
+		The droplet's public IPv6 address, or None if it has none.
+		"""
+		if self._public_ipv6 is _UNSET:
+			self._public_ipv6 = _public_address(self._data, "v6")
+		return self._public_ipv6
+
+
+
+def _public_address(data, version):
+	for network in data["networks"].get(version, ()):
+		if network["type"] == "public":
+			return network["ip_address"]
+	return None
@@ -0,0 +1,224 @@
+"""
+Client-side rate limiting for the DigitalOcean API.
+
+DigitalOcean allows 5,000 requests an hour and 250 a minute per token,
+and reports what is left in the `ratelimit-remaining` and
+`ratelimit-reset` response headers. The token is shared by several of
+our tools, so RateLimiter paces requests with a token bucket, holds off
+once the server says the hourly budget is nearly used up, and lets
+mutating calls go ahead of status polls when requests are queued.
+"""
+import contextlib
+import email.utils
+import random
+import threading
+import time
+
+
+# Request priorities, lowest number first
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Methods that are safe to repeat after a server error. Retrying a POST
+# after a 5xx could create a second droplet.
+IDEMPOTENT_METHODS = ("GET", "PUT", "DELETE", "HEAD")
+
+
+
+class RateLimiter:
+
+	def __init__(self, rate=250 / 60, burst=10, low_reserve=2, server_reserve=50,
+			max_retries=5, backoff=1, max_backoff=60):
+		"""
+		rate - number
+		Default: 250 / 60
+			Requests per second the bucket refills at.
+
+		burst - integer
+		Default: 10
+			Size of the bucket, i.e. the most requests sent at once.
+
+		low_reserve - integer
+		Default: 2
+			Tokens that LOW priority requests leave in the bucket, so a
+			mutating call never waits behind a poll.
+
+		server_reserve - integer
+		Default: 50
+			Once `ratelimit-remaining` drops to this, LOW priority
+			requests wait for `ratelimit-reset`. Everything waits once
+			it reaches 0.
+
+		max_retries - integer
+		Default: 5
+			Retries for a 429 or, for idempotent methods, a 5xx.
+
+		backoff - number
+		Default: 1
+			Seconds before the first retry, doubled for each one after,
+			unless the server sends Retry-After.
+
+		max_backoff - number
+		Default: 60
+			Upper bound on the seconds between retries.
+		"""
+		self.rate = rate
+		self.burst = burst
+		self.low_reserve = low_reserve
+		self.server_reserve = server_reserve
+		self.max_retries = max_retries
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+
+		self.remaining = None
+		self.reset_at = None
+		self.stats = {
+			"requests": 0,
+			"throttled": 0,
+			"throttled_seconds": 0.0,
+			"retries": 0,
+			"rate_limited": 0
+		}
+
+		self._tokens = float(burst)
+		self._refilled_at = time.monotonic()
+		self._waiting = [0, 0, 0]
+		self._cond = threading.Condition()
+		self._local = threading.local()
+
+
+	@contextlib.contextmanager
+	def priority(self, priority, deadline=None):
+		"""
+		Sets the default priority of requests made from this thread,
+		e.g. LOW around a polling loop, and optionally a deadline (a
+		time.monotonic() value) for acquire.
+		"""
+		previous = getattr(self._local, "priority", None), getattr(self._local, "deadline", None)
+		self._local.priority = priority
+		self._local.deadline = deadline
+		try:
+			yield
+		finally:
+			self._local.priority, self._local.deadline = previous
+
+
+	def default_priority(self, method):
+		priority = getattr(self._local, "priority", None)
+		if priority is not None:
+			return priority
+		return NORMAL if method == "GET" else HIGH
+
+
+	def acquire(self, priority=NORMAL, deadline=None):
+		"""
+		Blocks until a request of `priority` may be sent. Raises
+		TimeoutError, without waiting, if that would be after
+		`deadline` (a time.monotonic() value), which defaults to the one
+		set with priority(). Without one, it can wait until the hourly
+		`ratelimit-reset`.
+		"""
+		if deadline is None:
+			deadline = getattr(self._local, "deadline", None)
+		start = time.monotonic()
+		throttled = False
+		with self._cond:
+			self._waiting[priority] += 1
+			try:
+				while True:
+					wait = self._wait_time(priority)
+					if wait <= 0:
+						self._tokens -= 1
+						self.stats["requests"] += 1
+						break
+					if deadline is not None and time.monotonic() + wait > deadline:
+						raise TimeoutError(f"Rate limited for another {wait:.0f} seconds")
+					throttled = True
+					self._cond.wait(timeout=wait)
+			finally:
+				self._waiting[priority] -= 1
+				self._cond.notify_all()
+
+			if throttled:
+				self.stats["throttled"] += 1
+				self.stats["throttled_seconds"] += time.monotonic() - start
+
+
+	def _wait_time(self, priority):
+		"""
+		Seconds until a request of `priority` could go, or 0 if it can
+		go now. Called with the lock held.
+		"""
+		now = time.monotonic()
+		self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+		self._refilled_at = now
+
+		# Hold off if the server says the budget is used up
+		if self.remaining is not None and self.reset_at is not None:
+			reserve = self.server_reserve if priority == LOW else 0
+			until_reset = self.reset_at - time.time()
+			if self.remaining <= reserve and until_reset > 0:
+				return until_reset
+
+		# Higher priority requests go first
+		if any(self._waiting[:priority]):
+			return 1 / self.rate
+
+		needed = 1 + (self.low_reserve if priority == LOW else 0)
+		if self._tokens >= needed:
+			return 0
+		return (needed - self._tokens) / self.rate
+
+
+	def update(self, headers):
+		"""
+		Records the rate limit headers from a response.
+		"""
+		remaining = headers.get("ratelimit-remaining")
+		reset = headers.get("ratelimit-reset")
+		with self._cond:
+			if remaining is not None:
+				self.remaining = int(remaining)
+			if reset is not None:
+				self.reset_at = int(reset)
+			self._cond.notify_all()
+
+
+	def retry_delay(self, method, response, attempt):
+		"""
+		Returns the seconds to wait before retrying `response`, or None
+		if it should not be retried.
+		"""
+		if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+			return None
+		if response.status_code != 429 and method not in IDEMPOTENT_METHODS:
+			return None
+
+		if response.status_code == 429:
+			self.stats["rate_limited"] += 1
+		self.stats["retries"] += 1
+
+		retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+		if retry_after is not None:
+			return min(retry_after, self.max_backoff)
+
+		# Exponential backoff with full jitter
+		delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+		return random.uniform(delay / 2, delay)
+
+
+
+def _parse_retry_after(value):
+	if value is None:
+		return None
+	try:
+		return max(0.0, float(value))
+	except ValueError:
+		pass
+	try:
+		return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+	except (TypeError, ValueError):
+		return None
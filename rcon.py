@@ -0,0 +1,321 @@
+import re
+import socket
+import struct
+import threading
+import time
+
+
+RCON_PORT = 25575
+
+# Packet types
+SERVERDATA_RESPONSE_VALUE = 0
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_AUTH = 3
+
+# Sent after a command to find the end of a multi-packet response. The
+# server replies to unknown types with a single packet.
+_END_MARKER_TYPE = 200
+
+# The vanilla server reads a packet with a single read of up to this
+# many bytes, and drops the connection if it held anything else.
+_SERVER_READ_SIZE = 1460
+
+PLAYERS_RE = re.compile(
+	r"There are (\d+) (?:of a max of|/) (\d+) players online:?\s*(.*)")
+
+
+class RCONError(Exception):
+	pass
+
+
+def _encode(request_id, type, body):
+	data = struct.pack("<ii", request_id, type) + body.encode("utf-8") + b"\x00\x00"
+	return struct.pack("<i", len(data)) + data
+
+
+def _recv_exact(sock, size):
+	data = b""
+	while len(data) < size:
+		chunk = sock.recv(size - len(data))
+		if not chunk:
+			raise RCONError("Connection closed")
+		data += chunk
+	return data
+
+
+def _read_packet(sock):
+	length, = struct.unpack("<i", _recv_exact(sock, 4))
+	data = _recv_exact(sock, length)
+	request_id, type = struct.unpack("<ii", data[:8])
+	return request_id, type, data[8:-2].decode("utf-8", errors="replace")
+
+
+
+class RCON:
+	"""
+	Client for the Minecraft RCON protocol.
+
+	The connection is either opened to `host`:`port`, or given as an
+	already connected socket-like object (anything with sendall, recv,
+	settimeout and close, such as a paramiko channel).
+
+	rcon = RCON("127.0.0.1", password="secret")
+	rcon.command("list")
+	"""
+
+	def __init__(self, host=None, port=RCON_PORT, password="", timeout=10, sock=None):
+		if sock is None:
+			sock = socket.create_connection((host, port), timeout=timeout)
+		sock.settimeout(timeout)
+		self._sock = sock
+		self._next_id = 1
+		self._lock = threading.Lock()
+
+		self._login(password)
+
+
+	@classmethod
+	def over_ssh(cls, ssh, password, port=RCON_PORT, timeout=10):
+		"""
+		Opens an RCON connection tunnelled through an SSH connection,
+		so the RCON port does not need to be opened in the firewall.
+		"""
+		channel = ssh.get_transport().open_channel(
+			"direct-tcpip", ("127.0.0.1", port), ("127.0.0.1", 0),
+			timeout=timeout)
+		return cls(password=password, timeout=timeout, sock=channel)
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+
+	def close(self):
+		self._sock.close()
+
+
+	def _send(self, type, body):
+		request_id = self._next_id
+		self._next_id += 1
+		self._sock.sendall(_encode(request_id, type, body))
+		return request_id
+
+
+	def _login(self, password):
+		request_id = self._send(SERVERDATA_AUTH, password)
+
+		# Some servers send an empty response value before the auth
+		# response, so skip anything that isn't the auth response.
+		while True:
+			response_id, type, _ = _read_packet(self._sock)
+			if type == SERVERDATA_EXECCOMMAND:
+				break
+		if response_id == -1 or response_id != request_id:
+			raise RCONError("RCON authentication failed")
+
+
+	def command(self, cmd):
+		"""
+		Runs a console command and returns its output.
+		"""
+		with self._lock:
+			request_id = self._send(SERVERDATA_EXECCOMMAND, cmd)
+
+			# The end marker is only sent once the server has started
+			# answering, as the vanilla server drops the connection if
+			# two packets arrive in one read. It writes every packet of
+			# the response before reading the next request, so the
+			# marker's answer comes after all of them.
+			end_id = None
+			body = []
+			while True:
+				response_id, _, text = _read_packet(self._sock)
+				if end_id is None:
+					end_id = self._send(_END_MARKER_TYPE, "")
+				if response_id == end_id:
+					break
+				if response_id == request_id:
+					body.append(text)
+			return "".join(body)
+
+
+	def save_all(self, flush=True):
+		"""
+		Saves the world to disk. With `flush`, blocks until the save is
+		written out.
+		"""
+		return self.command("save-all flush" if flush else "save-all")
+
+
+	def players(self):
+		"""
+		Returns a dict of the "online" and "max" player counts and the
+		"names" of the players online.
+		"""
+		resp = self.command("list")
+		match = PLAYERS_RE.search(resp)
+		if match is None:
+			raise RCONError(f"Unexpected response to list: {resp!r}")
+		names = [name.strip() for name in match.group(3).split(",") if name.strip()]
+		return {
+			"online": int(match.group(1)),
+			"max": int(match.group(2)),
+			"names": names
+		}
+
+
+	def shutdown(self):
+		"""
+		Turns off autosave, flushes the world to disk and stops the
+		server. Returns once the stop has been accepted; the process
+		exits some time after.
+		"""
+		self.command("save-off")
+		self.save_all(flush=True)
+		try:
+			self.command("stop")
+		except (RCONError, OSError):
+			# The server may close the connection as it stops
+			pass
+
+
+
+def wait_until_ready(connect, timeout=600, interval=2, log=print):
+	"""
+	Waits until the server's RCON port accepts a login, which only
+	happens once the world has finished loading ("Done"). Returns the
+	connected RCON client and the seconds waited.
+
+	connect (required) - callable
+		Returns a new RCON client, e.g.
+		`lambda: RCON.over_ssh(ssh, password)`.
+
+	timeout - number
+	Default: 600
+		Maximum number of seconds to wait.
+
+	interval - number
+	Default: 2
+		Seconds between attempts.
+	"""
+	start = time.monotonic()
+	while True:
+		try:
+			rcon = connect()
+		except RCONError:
+			# A wrong password will not fix itself
+			raise
+		except Exception as e:
+			if time.monotonic() - start >= timeout:
+				raise TimeoutError(f"RCON not ready after {timeout} seconds") from e
+			time.sleep(interval)
+			continue
+
+		elapsed = time.monotonic() - start
+		if log is not None:
+			log(f"  Server ready after {elapsed:.1f}s")
+		return rcon, elapsed
+
+
+
+class FakeRCONServer:
+	"""
+	Local stand-in for a Minecraft server's RCON port, for trying the
+	client without a real server. Runs in a background thread.
+
+	Responds to "list" with the `players` given, to "stop" by closing,
+	and echoes any other command. Commands received are recorded in
+	`commands`. Responses longer than `max_packet` are split over
+	several packets, as the real server does. Like the real server, it
+	reads each packet with a single read and drops the connection if
+	the read held more than one packet.
+
+	with FakeRCONServer(password="secret") as server:
+		rcon = RCON("127.0.0.1", server.port, "secret")
+	"""
+
+	def __init__(self, password="", players=(), max_players=20, max_packet=4096):
+		self.password = password
+		self.players = list(players)
+		self.max_players = max_players
+		self.max_packet = max_packet
+		self.commands = []
+		self.stopped = threading.Event()
+
+		self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self._sock.bind(("127.0.0.1", 0))
+		self._sock.listen()
+		self.port = self._sock.getsockname()[1]
+		threading.Thread(target=self._serve, daemon=True).start()
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+
+	def close(self):
+		self._sock.close()
+
+
+	def _serve(self):
+		while True:
+			try:
+				conn, _ = self._sock.accept()
+			except OSError:
+				return
+			threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+
+	def _handle(self, conn):
+		authed = False
+		with conn:
+			try:
+				while True:
+					data = conn.recv(_SERVER_READ_SIZE)
+					if len(data) < 4:
+						return
+					length, = struct.unpack("<i", data[:4])
+					if length != len(data) - 4:
+						# Pipelined or split packets
+						return
+					request_id, type = struct.unpack("<ii", data[4:12])
+					body = data[12:-2].decode("utf-8", errors="replace")
+					if type == SERVERDATA_AUTH:
+						authed = body == self.password
+						conn.sendall(_encode(SERVERDATA_RESPONSE_VALUE, SERVERDATA_RESPONSE_VALUE, ""))
+						conn.sendall(_encode(request_id if authed else -1, SERVERDATA_EXECCOMMAND, ""))
+					elif not authed:
+						return
+					elif type == SERVERDATA_EXECCOMMAND:
+						self.commands.append(body)
+						resp = self._respond(body)
+						for i in range(0, max(len(resp), 1), self.max_packet):
+							chunk = resp[i:i + self.max_packet]
+							conn.sendall(_encode(request_id, SERVERDATA_RESPONSE_VALUE, chunk))
+						if body == "stop":
+							self.stopped.set()
+							return
+					else:
+						conn.sendall(_encode(request_id, SERVERDATA_RESPONSE_VALUE, f"Unknown request {type:x}"))
+			except (RCONError, OSError):
+				return
+
+
+	def _respond(self, cmd):
+		if cmd == "list":
+			return (f"There are {len(self.players)} of a max of {self.max_players}"
+				f" players online: {', '.join(self.players)}")
+		if cmd == "stop":
+			return "Stopping the server"
+		if cmd.startswith("save-all"):
+			return "Saved the game"
+		return cmd
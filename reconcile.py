@@ -0,0 +1,496 @@
+"""
+Declarative reconcile engine for the server stack.
+
+A spec describes the droplet, volume and DNS record we want. The
+current state is read from the API, diffed against the spec, and only
+the calls needed to close the gap are made, so re-running after an
+interrupted or repeated run does not duplicate billed resources.
+
+spec = {
+	"droplet": {
+		"present": True,
+		"standby": False,
+		"name": "DO-MinecraftServer",
+		"region": "sgp1",
+		"size": "s-2vcpu-4gb",
+		"image": "ubuntu-20-04-x64",
+		"image_name": "DO-MinecraftServer-base",
+		"user_data": "...",
+		"ipv6": True,
+		"ssh_keys": [...],
+		"tags": ["DO-MinecraftServer"]
+	},
+	"volume": {"name": "do-minecraft-server"},
+	"dns": {
+		"domain": "example.com",
+		"name": "mc",
+		"type": "A",
+		"ipv6": True,
+		"srv_port": 25565,
+		"ttl": 1800,
+		"low_ttl": 30
+	}
+}
+
+"image_name" is a private snapshot to prefer over "image" when it
+exists. "user_data" is only used when booting "image". The volume is
+looked for in the droplet's region. With "present" false, the volume is
+detached and the droplet deleted instead.
+
+The DNS record points at the droplet's IPv4 address. With "ipv6", an
+AAAA record for the same name points at its IPv6 address, and with
+"srv_port", a `_minecraft._tcp` SRV record gives the server's port.
+All of them are brought in line in one pass with sync_records, with
+"ttl" as their TTL. state["record_changed_at"] is the time.time() the
+A record was changed, or None if it was already right.
+
+The droplet's IP changes every time it is recreated, so with "low_ttl",
+deleting the droplet first lowers the TTL of the records to it. By the
+next start, resolvers only hold the old address for that long, and the
+records go back to "ttl" once they point at the new droplet.
+
+With "standby", "present" false powers the droplet off instead, leaving
+the volume attached and the DNS records alone. It keeps its IP while
+off (and is still billed), so the next start only has to power it back
+on. An "off" droplet is always powered on when "present" is true, and
+state["powered_on"] says whether that happened. The OS is given
+"shutdown_timeout" seconds (default 60) to shut down, after which the
+power is cut, retrying for up to "power_off_timeout" (default 120)
+while the shutdown is still pending.
+
+The firewall is part of the droplet's own setup (the image or its
+user_data), so it is not reconciled here.
+
+With a StateCache, known IDs are looked up directly instead of listing.
+While the cache entry for the DNS records is fresh and matches what is
+wanted, the domain is not listed, and each cached record is only
+fetched by ID to check it is still there and unchanged. Entries the API
+answers 404 for are dropped and looked up again.
+"""
+import asyncio
+import time
+
+import tracing
+from digitalocean import DomainAPI
+from models import Droplet
+from state_cache import is_not_found
+
+
+# Seconds between attempts to power off a droplet that has an action
+# in progress
+POWER_OFF_RETRY_INTERVAL = 2
+
+
+class Reconciler:
+
+	def __init__(self, api, spec, cache=None, log=print):
+		"""
+		api (required) - AsyncDigitalOceanAPI
+			The client to reconcile through.
+
+		spec (required) - dict
+			The desired state, as described above.
+
+		cache - StateCache, Nullable
+			Cache of resource IDs to consult before listing.
+		"""
+		self.api = api
+		self.spec = spec
+		self.cache = cache
+		self.log = log if log is not None else (lambda *args: None)
+		self.state = {}
+		self.changes = []
+		self._domain_records = None
+
+
+	async def observe(self):
+		"""
+		Reads the current state of every resource in the spec, all at
+		once. Returns the state dict, with "droplet", "volume" and
+		"record" set to the API payloads, or None where missing.
+		"""
+		with tracing.phase("observe"):
+			droplet, volume, record = await asyncio.gather(
+				self._find_droplet(), self._find_volume(), self._find_record())
+		self.state = {"droplet": droplet, "volume": volume, "record": record}
+		return self.state
+
+
+	async def run(self):
+		"""
+		Observes the current state, unless observe was already called,
+		and applies whatever changes are needed. Returns the final
+		state. The changes made are listed in `changes`; an empty list
+		means everything was already in place.
+		"""
+		if not self.state:
+			await self.observe()
+		if self.spec["droplet"].get("present", True):
+			with tracing.phase("droplet"):
+				await self._ensure_droplet()
+			await asyncio.gather(self._traced("dns", self._ensure_record()),
+				self._traced("volume", self._ensure_volume_attached()))
+		elif self.spec["droplet"].get("standby"):
+			with tracing.phase("droplet"):
+				await self._ensure_droplet_off()
+		else:
+			with tracing.phase("dns"):
+				await self._lower_record_ttl()
+			with tracing.phase("volume"):
+				await self._ensure_volume_detached()
+			with tracing.phase("droplet"):
+				await self._ensure_droplet_absent()
+
+		if not self.changes:
+			self.log("  Everything already up to date")
+		return self.state
+
+
+	@staticmethod
+	async def _traced(name, coro):
+		with tracing.phase(name):
+			return await coro
+
+
+	def _change(self, description):
+		self.changes.append(description)
+		self.log(f"  {description}")
+
+
+	def _cache_key(self, kind):
+		if kind == "droplet":
+			return f"{self.spec['droplet']['name']}/{self.spec['droplet']['region']}"
+		if kind == "volume":
+			return f"{self.spec['volume']['name']}/{self.spec['droplet']['region']}"
+		spec = self.spec["dns"]
+		return f"{spec['name']}.{spec['domain']}/{spec.get('type', 'A')}"
+
+
+	def _cache_get(self, kind):
+		if self.cache is None:
+			return None
+		return self.cache.get(kind, self._cache_key(kind))
+
+
+	def _cache_set(self, kind, value):
+		if self.cache is None:
+			return
+		if value is None:
+			self.cache.invalidate(kind, self._cache_key(kind))
+		else:
+			self.cache.set(kind, self._cache_key(kind), value)
+
+
+	async def _find_droplet(self):
+		spec = self.spec["droplet"]
+
+		cached = self._cache_get("droplet")
+		if cached is not None:
+			resp = await self.api.droplets.get(cached["id"])
+			if not is_not_found(resp):
+				return resp["droplet"]
+			self._cache_set("droplet", None)
+
+		tags = spec.get("tags", [])
+		async for droplet in self.api.droplets.iter_all(tag_name=tags[0] if tags else None, stream=True):
+			if droplet["name"] == spec["name"] and droplet["region"]["slug"] == spec["region"]:
+				self._cache_set("droplet", {"id": droplet["id"]})
+				return droplet
+		return None
+
+
+	async def _find_volume(self):
+		if "volume" not in self.spec:
+			return None
+
+		cached = self._cache_get("volume")
+		if cached is not None:
+			resp = await self.api.volumes.get(cached["id"])
+			if not is_not_found(resp):
+				return resp["volume"]
+			self._cache_set("volume", None)
+
+		volumes = (await self.api.volumes.list(
+			name=self.spec["volume"]["name"],
+			region=self.spec["droplet"]["region"]))["volumes"]
+		if not volumes:
+			return None
+		self._cache_set("volume", {"id": volumes[0]["id"]})
+		return volumes[0]
+
+
+	async def _find_record(self):
+		if "dns" not in self.spec:
+			return None
+
+		# A fresh cache entry saves listing the domain. _ensure_record
+		# checks the cached records by ID before relying on it.
+		cached = self._cache_get("record")
+		if cached is not None:
+			return cached
+
+		# List every record once, so sync_records can reuse the listing
+		spec = self.spec["dns"]
+		self._domain_records = [record async for record in self.api.domains.iter_records(spec["domain"])]
+		for record in self._domain_records:
+			if record["type"] == spec.get("type", "A") and record["name"] == spec["name"]:
+				return record
+		return None
+
+
+	async def _ensure_droplet(self):
+		spec = self.spec["droplet"]
+		droplet = self.state["droplet"]
+
+		if droplet is None:
+			# Prefer the pre-built image, and only set up the stock image
+			# on boot when there isn't one.
+			image = None
+			if spec.get("image_name") is not None:
+				image = await self.api.images.find_by_name(spec["image_name"], region=spec["region"])
+			if image is not None:
+				create_kwargs = {"image": image["id"]}
+			else:
+				create_kwargs = {"image": spec["image"]}
+				if spec.get("user_data") is not None:
+					create_kwargs["user_data"] = spec["user_data"]
+
+			droplet = (await self.api.droplets.create(
+				name=spec["name"],
+				region=spec["region"],
+				size=spec["size"],
+				ssh_keys=spec.get("ssh_keys", []),
+				tags=spec.get("tags", []),
+				monitoring=spec.get("monitoring", True),
+				ipv6=spec.get("ipv6", False),
+				**create_kwargs))["droplet"]
+			self._cache_set("droplet", {"id": droplet["id"]})
+			self._change(f"Created Droplet {droplet['id']} from "
+				+ (f"image {image['name']}" if image is not None else spec["image"]))
+
+		elif droplet["size_slug"] != spec["size"]:
+			# Resizing needs a power cycle, so only report it
+			self.log(f"  Droplet is {droplet['size_slug']}, not {spec['size']}. Not resizing.")
+
+		self.state["powered_on"] = False
+		if droplet["status"] == "off":
+			await self.api.wait(await self.api.droplets.power_on(droplet["id"]))
+			self.state["powered_on"] = True
+			self._change(f"Powered on Droplet {droplet['id']}")
+
+		if droplet["status"] != "active":
+			self.log("  Waiting for Droplet to start...")
+			droplet = await self.api.droplets.wait_for_droplet(droplet["id"], state="active")
+			metrics = self.api.sync.droplets.last_wait_metrics
+			self._change(f"Droplet {droplet['id']} is now active"
+				f" ({metrics['polls']} polls, {metrics['elapsed']:.1f}s)")
+
+		self.state["droplet"] = droplet
+		self.state["droplet_ip"] = public_ip(droplet)
+		self.state["droplet_ipv6"] = Droplet(droplet).public_ipv6
+		self.state["from_image"] = droplet["image"].get("name") == spec.get("image_name")
+
+
+	def _record_keys(self):
+		spec = self.spec["dns"]
+		keys = {(spec.get("type", "A"), spec["name"])}
+		if spec.get("ipv6"):
+			keys.add(("AAAA", spec["name"]))
+		if spec.get("srv_port") is not None:
+			keys.add(("SRV", f"_minecraft._tcp.{spec['name']}"))
+		return keys
+
+
+	def _desired_records(self):
+		spec = self.spec["dns"]
+		ttl = spec.get("ttl")
+		records = [
+			{"type": spec.get("type", "A"), "name": spec["name"], "data": self.state["droplet_ip"], "ttl": ttl}
+		]
+		if spec.get("ipv6"):
+			if self.state["droplet_ipv6"] is not None:
+				records.append({"type": "AAAA", "name": spec["name"], "data": self.state["droplet_ipv6"], "ttl": ttl})
+			else:
+				self.log("  Droplet has no public IPv6 address. Not adding AAAA record.")
+		if spec.get("srv_port") is not None:
+			records.append({
+				"type": "SRV",
+				"name": f"_minecraft._tcp.{spec['name']}",
+				"data": f"{spec['name']}.{spec['domain']}.",
+				"priority": 0,
+				"weight": 0,
+				"port": spec["srv_port"],
+				"ttl": ttl
+			})
+		return records
+
+
+	async def _ensure_record(self):
+		if "dns" not in self.spec:
+			return
+		spec = self.spec["dns"]
+		desired = self._desired_records()
+
+		self.state["record_changed_at"] = None
+		cached = self._cache_get("record")
+		if cached is not None and cached.get("records") == desired:
+			if await self._cached_records_exist(cached):
+				self.state["record"] = cached
+				return
+			self._cache_set("record", None)
+
+		result = await self.api.domains.sync_records(
+			spec["domain"], desired, existing=self._domain_records)
+		if result["errors"]:
+			messages = ", ".join(str((resp or {}).get("message")) for _, resp in result["errors"])
+			raise RuntimeError(f"Failed to update DNS records: {messages}")
+
+		for outcome in ("created", "updated", "deleted"):
+			for record in result[outcome]:
+				self._change(f"{outcome.capitalize()} {record['type']} record"
+					f" {record['name']}.{spec['domain']} -> {record['data']}")
+
+		records = result["created"] + result["updated"] + result["unchanged"]
+		ids = [next(r["id"] for r in records if r["type"] == d["type"] and r["name"] == d["name"])
+			for d in desired]
+		record = next(r for r in records if r["id"] == ids[0])
+		previous = self.state["record"]
+		if previous is None or previous["data"] != record["data"]:
+			self.state["record_changed_at"] = time.time()
+		self._cache_set("record", {"id": record["id"], "data": record["data"], "records": desired, "ids": ids})
+		self.state["record"] = record
+
+
+	async def _cached_records_exist(self, cached):
+		# The records can be changed or deleted outside of here (e.g. in
+		# the control panel), so check that each cached ID still holds
+		# the record we want. This is one round trip, as the gets run
+		# together, where sync_records would list the whole domain.
+		if "ids" not in cached:
+			return False
+		domain = self.spec["dns"]["domain"]
+		resps = await asyncio.gather(*[self.api.domains.get_record(domain, record_id)
+			for record_id in cached["ids"]])
+		return all("domain_record" in resp and DomainAPI._record_matches(domain, resp["domain_record"], desired)
+			for resp, desired in zip(resps, cached["records"]))
+
+
+	async def _lower_record_ttl(self):
+		if "dns" not in self.spec or self.spec["dns"].get("low_ttl") is None:
+			return
+		spec = self.spec["dns"]
+		low_ttl = spec["low_ttl"]
+
+		records = self._domain_records
+		if records is None:
+			records = [record async for record in self.api.domains.iter_records(spec["domain"])]
+		keys = self._record_keys()
+		records = [r for r in records if (r["type"], r["name"]) in keys and r["ttl"] > low_ttl]
+		if not records:
+			return
+
+		await asyncio.gather(*[
+			self.api.domains.update_record(
+				domain_name=spec["domain"],
+				domain_record_id=record["id"],
+				type=record["type"],
+				ttl=low_ttl)
+			for record in records])
+		self._cache_set("record", None)
+		for record in records:
+			self._change(f"Lowered TTL of {record['type']} record"
+				f" {record['name']}.{spec['domain']} to {low_ttl}s")
+
+
+	async def _ensure_volume_attached(self):
+		volume = self.state["volume"]
+		if volume is None:
+			if "volume" in self.spec:
+				raise LookupError(f"Volume {self.spec['volume']['name']} not found")
+			return
+		droplet_id = self.state["droplet"]["id"]
+
+		if droplet_id in volume["droplet_ids"]:
+			return
+
+		# A volume can only be attached to one droplet at a time
+		for other_id in volume["droplet_ids"]:
+			await self.api.wait(await self.api.volumes.detach(
+				volume["id"], other_id, region=volume["region"]["slug"]))
+			self._change(f"Detached Volume {volume['name']} from Droplet {other_id}")
+
+		await self.api.wait(await self.api.volumes.attach(
+			volume["id"], droplet_id, region=volume["region"]["slug"]))
+		volume["droplet_ids"] = [droplet_id]
+		self._change(f"Attached Volume {volume['name']} to Droplet {droplet_id}")
+
+
+	async def _ensure_volume_detached(self):
+		volume = self.state["volume"]
+		droplet = self.state["droplet"]
+		if volume is None or droplet is None or droplet["id"] not in volume["droplet_ids"]:
+			return
+
+		await self.api.wait(await self.api.volumes.detach(
+			volume["id"], droplet["id"], region=volume["region"]["slug"]))
+		volume["droplet_ids"].remove(droplet["id"])
+		self._change(f"Detached Volume {volume['name']} from Droplet {droplet['id']}")
+
+
+	async def _ensure_droplet_off(self):
+		droplet = self.state["droplet"]
+		if droplet is None or droplet["status"] == "off":
+			return
+
+		# Let the OS shut down cleanly, and only cut the power if it
+		# does not
+		try:
+			await self.api.wait(await self.api.droplets.shutdown(droplet["id"]),
+				timeout=self.spec["droplet"].get("shutdown_timeout", 60))
+			self._change(f"Shut down Droplet {droplet['id']}")
+		except (RuntimeError, TimeoutError) as e:
+			self.log(f"  Shutdown did not finish ({e}). Powering off.")
+			await self._power_off(droplet, self.spec["droplet"].get("power_off_timeout", 120))
+		droplet["status"] = "off"
+
+
+	async def _power_off(self, droplet, timeout):
+		# A shutdown that timed out on our side is usually still going,
+		# and the API refuses other actions on the droplet (422, "pending
+		# event") until it ends. Keep trying until then, unless it turns
+		# out to have powered the droplet off after all.
+		deadline = time.monotonic() + timeout
+		while True:
+			action = await self.api.droplets.power_off(droplet["id"])
+			if action.data is not None:
+				await self.api.wait(action)
+				self._change(f"Powered off Droplet {droplet['id']}")
+				return
+
+			current = (await self.api.droplets.get(droplet["id"], use_cache=False))["droplet"]
+			if current["status"] == "off":
+				self._change(f"Shut down Droplet {droplet['id']}")
+				return
+			if time.monotonic() >= deadline:
+				raise RuntimeError(f"Could not power off Droplet {droplet['id']}:"
+					f" {action.response.get('message')}")
+			await asyncio.sleep(POWER_OFF_RETRY_INTERVAL)
+
+
+	async def _ensure_droplet_absent(self):
+		droplet = self.state["droplet"]
+		if droplet is None:
+			return
+
+		await self.api.droplets.delete(droplet["id"])
+		self._cache_set("droplet", None)
+		self.state["droplet"] = None
+		self._change(f"Deleted Droplet {droplet['id']}")
+
+
+
+def public_ip(droplet):
+	"""
+	Returns a droplet's public IPv4 address.
+	"""
+	return Droplet(droplet).public_ip
@@ -0,0 +1,205 @@
+"""
+Minecraft Server List Ping client.
+
+Performs the same handshake + status exchange as the multiplayer
+server list, which tells us whether the game port is actually serving
+players, what it reports, and the round-trip latency.
+
+	python server_ping.py [host] [port] [count]
+
+Defaults to the DO_SUBDOMAIN.DO_DOMAIN name, so it can be run as a
+standalone health and latency check against the live server.
+"""
+import json
+import os
+import socket
+import statistics
+import struct
+import sys
+import time
+
+
+MINECRAFT_PORT = 25565
+
+# Any recent protocol version works for a status request
+PROTOCOL_VERSION = 757
+
+
+class PingError(Exception):
+	pass
+
+
+def _varint(value):
+	out = b""
+	value &= 0xFFFFFFFF
+	while True:
+		byte = value & 0x7F
+		value >>= 7
+		if value:
+			out += bytes([byte | 0x80])
+		else:
+			return out + bytes([byte])
+
+
+def _unpack_varint(data, offset=0):
+	value = 0
+	for i in range(5):
+		if offset >= len(data):
+			raise PingError("Truncated VarInt")
+		byte = data[offset]
+		offset += 1
+		value |= (byte & 0x7F) << (7 * i)
+		if not byte & 0x80:
+			return value, offset
+	raise PingError("VarInt too long")
+
+
+def _read_varint(sock):
+	data = b""
+	while True:
+		data += _recv_exact(sock, 1)
+		if not data[-1] & 0x80 or len(data) == 5:
+			return _unpack_varint(data)[0]
+
+
+def _packet(packet_id, data=b""):
+	body = _varint(packet_id) + data
+	return _varint(len(body)) + body
+
+
+def _recv_exact(sock, size):
+	data = b""
+	while len(data) < size:
+		chunk = sock.recv(size - len(data))
+		if not chunk:
+			raise PingError("Connection closed")
+		data += chunk
+	return data
+
+
+def _read_packet(sock):
+	length = _read_varint(sock)
+	data = _recv_exact(sock, length)
+
+	packet_id, offset = _unpack_varint(data)
+	return packet_id, data[offset:]
+
+
+def ping(host, port=MINECRAFT_PORT, timeout=5):
+	"""
+	Pings a Minecraft server and returns a dict with:
+
+	online - integer
+		Number of players online.
+
+	max - integer
+		Maximum number of players.
+
+	version - string
+		The server's reported version name.
+
+	latency - number
+		Round-trip time of the ping/pong exchange, in seconds.
+
+	connect_time - number
+		Time to open the TCP connection, in seconds.
+
+	status - dict
+		The full status response.
+
+	Raises PingError or OSError if the server does not answer.
+	"""
+	start = time.perf_counter()
+	with socket.create_connection((host, port), timeout=timeout) as sock:
+		connect_time = time.perf_counter() - start
+
+		# Handshake with next state 1 (status), then a status request
+		host_bytes = host.encode("utf-8")
+		handshake = (
+			_varint(PROTOCOL_VERSION)
+			+ _varint(len(host_bytes)) + host_bytes
+			+ struct.pack(">H", port)
+			+ _varint(1))
+		sock.sendall(_packet(0x00, handshake) + _packet(0x00))
+
+		packet_id, data = _read_packet(sock)
+		if packet_id != 0x00:
+			raise PingError(f"Unexpected packet {packet_id:#x}")
+		length, offset = _unpack_varint(data)
+		status = json.loads(data[offset:offset + length].decode("utf-8"))
+
+		# Time a ping/pong exchange for latency
+		payload = struct.pack(">q", int(time.time() * 1000))
+		sent = time.perf_counter()
+		sock.sendall(_packet(0x01, payload))
+		packet_id, data = _read_packet(sock)
+		latency = time.perf_counter() - sent
+		if packet_id != 0x01 or data != payload:
+			raise PingError("Bad pong")
+
+	players = status.get("players", {})
+	return {
+		"online": players.get("online", 0),
+		"max": players.get("max", 0),
+		"version": status.get("version", {}).get("name"),
+		"latency": latency,
+		"connect_time": connect_time,
+		"status": status
+	}
+
+
+def wait_until_ready(host, port=MINECRAFT_PORT, timeout=600, interval=2, log=print):
+	"""
+	Pings the server until it answers, for use as a readiness gate.
+	Returns the first successful ping result, with the seconds waited
+	added as "waited". Raises TimeoutError after `timeout` seconds.
+	"""
+	start = time.monotonic()
+	while True:
+		attempt = time.monotonic()
+		try:
+			result = ping(host, port, timeout=interval)
+		except (PingError, OSError) as e:
+			if attempt - start >= timeout:
+				raise TimeoutError(
+					f"{host}:{port} not answering after {timeout} seconds") from e
+			time.sleep(max(0, interval - (time.monotonic() - attempt)))
+			continue
+
+		result["waited"] = time.monotonic() - start
+		if log is not None:
+			log(f"  {host}:{port} answering after {result['waited']:.1f}s"
+				f" ({result['version']}, {result['online']}/{result['max']} players,"
+				f" {result['latency'] * 1000:.0f} ms)")
+		return result
+
+
+def main():
+	host = sys.argv[1] if len(sys.argv) > 1 else \
+		f"{os.environ.get('DO_SUBDOMAIN')}.{os.environ.get('DO_DOMAIN')}"
+	port = int(sys.argv[2]) if len(sys.argv) > 2 else MINECRAFT_PORT
+	count = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+	latencies = []
+	for _ in range(count):
+		try:
+			result = ping(host, port)
+		except (PingError, OSError) as e:
+			print(f"{host}:{port} not answering: {e}")
+			continue
+		latencies.append(result["latency"] * 1000)
+		print(f"{host}:{port} {result['version']}"
+			f" {result['online']}/{result['max']} players"
+			f" connect {result['connect_time'] * 1000:.1f} ms"
+			f" ping {latencies[-1]:.1f} ms")
+		time.sleep(0.5)
+
+	if latencies:
+		print(f"\n{len(latencies)}/{count} answered,"
+			f" min {min(latencies):.1f} ms,"
+			f" median {statistics.median(latencies):.1f} ms,"
+			f" max {max(latencies):.1f} ms")
+
+
+if __name__ == "__main__":
+	main()
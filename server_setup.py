@@ -0,0 +1,117 @@
+"""
+Shell steps for setting up a droplet to run the Minecraft server.
+
+Each function returns a list of (name, command) steps, as taken by
+ssh.run_steps. The same steps are used when setting up a stock droplet
+over SSH and when baking them into a snapshot with build_image.py.
+"""
+
+MOUNT_POINT = "/mnt/mc"
+START_SCRIPT = f"{MOUNT_POINT}/start.sh"
+JAVA = f"{MOUNT_POINT}/jdk/bin/java"
+SERVICE_NAME = "minecraft"
+
+SERVICE_UNIT = f"""[Unit]
+Description=Minecraft Server
+After=network-online.target
+RequiresMountsFor={MOUNT_POINT}
+ConditionPathExists={START_SCRIPT}
+
+[Service]
+ExecStart={START_SCRIPT}
+SuccessExitStatus=143
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+
+def device_path(volume_name):
+	return f"/dev/disk/by-id/scsi-0DO_Volume_{volume_name}"
+
+
+def mount_steps(volume_name, timeout=60):
+	"""
+	Waits for the attached volume's block device, then mounts it.
+	"""
+	device = device_path(volume_name)
+	return [
+		("mount", f"timeout {timeout} sh -c 'until [ -e {device} ]; do sleep 0.2; done'"
+			f" && mkdir -p {MOUNT_POINT}"
+			f" && mount -o discard,defaults,noatime {device} {MOUNT_POINT}"),
+	]
+
+
+def swap_steps(size="4G", persist=False):
+	"""
+	Creates and enables a swapfile. With `persist`, it is also added to
+	fstab so it survives a reboot.
+	"""
+	cmd = (f"fallocate -l {size} /swapfile"
+		" && chmod 600 /swapfile"
+		" && mkswap /swapfile"
+		" && swapon /swapfile"
+		" && sysctl vm.swappiness=10")
+	if persist:
+		cmd += (" && echo '/swapfile none swap sw 0 0' >> /etc/fstab"
+			" && echo 'vm.swappiness=10' > /etc/sysctl.d/99-swappiness.conf")
+	return [("swap", cmd)]
+
+
+def firewall_steps():
+	"""
+	Opens the firewall for SSH and the Minecraft server, and enables it.
+	"""
+	return [
+		("ufw allow", "ufw allow OpenSSH && ufw allow 25565/tcp && ufw allow 25565/udp"),
+		("ufw enable", "yes | ufw enable"),
+	]
+
+
+def start_steps():
+	"""
+	Starts the Minecraft server in the background.
+	"""
+	return [
+		("start server", f"nohup {START_SCRIPT} > ~/minecraftserver.log 2>&1 &"),
+	]
+
+
+def start_script_steps(content, restart=False, timeout=600):
+	"""
+	Writes `content` to the start script on the volume, once it is
+	mounted, if it is not already what it holds. With `restart`, a
+	server already running under systemd is restarted to pick up the
+	change.
+	"""
+	new = f"{START_SCRIPT}.new"
+	restart_cmd = f" && systemctl try-restart {SERVICE_NAME}" if restart else ""
+	return [
+		("start script", f"timeout {timeout} sh -c 'until mountpoint -q {MOUNT_POINT}; do sleep 0.2; done'"
+			f" && cat > {new} <<'EOF'\n{content}EOF\n"
+			f"chmod +x {new} && if cmp -s {new} {START_SCRIPT}; then rm {new};"
+			f" else mv {new} {START_SCRIPT}{restart_cmd}; fi"),
+	]
+
+
+def image_steps(volume_name, swap_size="4G"):
+	"""
+	Persistent setup for a snapshot image. The volume is mounted from
+	fstab as soon as it is attached, and a systemd unit starts the
+	server once it is mounted, so a droplet booted from the image needs
+	no setup over SSH.
+	"""
+	device = device_path(volume_name)
+	fstab = (f"{device} {MOUNT_POINT} ext4"
+		" defaults,nofail,discard,noatime,x-systemd.device-timeout=10min 0 2")
+	return [
+		("mount unit", f"mkdir -p {MOUNT_POINT}"
+			f" && {{ grep -q ' {MOUNT_POINT} ' /etc/fstab || echo '{fstab}' >> /etc/fstab; }}"),
+		*swap_steps(swap_size, persist=True),
+		*firewall_steps(),
+		("service", f"cat > /etc/systemd/system/{SERVICE_NAME}.service <<'EOF'\n{SERVICE_UNIT}EOF\n"
+			f"systemctl daemon-reload && systemctl enable {SERVICE_NAME}"),
+
+		# Let cloud-init run again on droplets booted from the image
+		("clean", "cloud-init clean --logs && apt-get clean"),
+	]
@@ -0,0 +1,378 @@
+import errno
+import functools
+import os
+import select
+import socket
+import time
+import uuid
+from pathlib import Path
+
+import paramiko
+
+import tracing
+
+
+SSH_PORT = 22
+
+# Errors that mean sshd is not ready yet, rather than a real failure
+RETRY_ERRORS = (
+	paramiko.SSHException,
+	paramiko.ssh_exception.NoValidConnectionsError,
+	socket.error,
+	EOFError)
+
+# Subclasses of SSHException that retrying will not fix, such as a
+# wrong key
+FATAL_ERRORS = (
+	paramiko.AuthenticationException,
+	paramiko.BadHostKeyException)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_key(path):
+	with open(path, "r") as stream:
+		return paramiko.RSAKey.from_private_key(stream)
+
+
+def load_key(path=None):
+	"""
+	Loads the RSA private key at `path`, defaulting to `DO_SSH_KEY`.
+	Keys are cached, so each file is only read and parsed once.
+	"""
+	if path is None:
+		path = os.environ.get("DO_SSH_KEY")
+	return _load_key(str(Path(path).expanduser()))
+
+
+def port_open(host, port=SSH_PORT, timeout=0.5):
+	"""
+	Returns True if a TCP connection to `host`:`port` can be made
+	within `timeout` seconds. Uses a non-blocking connect, so a closed
+	or filtered port costs at most `timeout`.
+	"""
+	family = socket.AF_INET6 if ":" in host else socket.AF_INET
+	sock = socket.socket(family, socket.SOCK_STREAM)
+	sock.setblocking(False)
+	try:
+		err = sock.connect_ex((host, port))
+		if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+			return False
+		_, writable, _ = select.select([], [sock], [], timeout)
+		if not writable:
+			return False
+		return sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+	finally:
+		sock.close()
+
+
+def wait_for_port(host, port=SSH_PORT, timeout=300, interval=0.5):
+	"""
+	Probes `host`:`port` every `interval` seconds until it accepts
+	connections. Returns the seconds waited, or raises TimeoutError.
+	"""
+	start = time.monotonic()
+	deadline = start + timeout
+	while True:
+		probe_start = time.monotonic()
+		if port_open(host, port, timeout=interval):
+			return time.monotonic() - start
+		if probe_start >= deadline:
+			raise TimeoutError(f"{host}:{port} not open after {timeout} seconds")
+
+		# A refused connection returns instantly, so pace the probes
+		time.sleep(max(0, interval - (time.monotonic() - probe_start)))
+
+
+def connect(host, username="root", key=None, timeout=300, interval=0.5, log=print):
+	"""
+	Connects to `host` over SSH once it is ready, and returns the
+	paramiko.SSHClient.
+
+	Port 22 is probed first with a cheap socket check, and the paramiko
+	key exchange is only attempted once it is open. If sshd accepts the
+	connection but is not ready to authenticate yet, the connect is
+	retried until `timeout`. A rejected key or host key is raised
+	straight away.
+
+	host (required) - string
+		The address of the server.
+
+	username - string
+	Default: "root"
+		The user to log in as.
+
+	key - paramiko.PKey
+	Default: load_key()
+		The private key to authenticate with.
+
+	timeout - number
+	Default: 300
+		Maximum number of seconds to wait for the server.
+
+	interval - number
+	Default: 0.5
+		Seconds between readiness probes.
+
+	log - callable, Nullable
+	Default: print
+		Called with progress messages.
+	"""
+	if key is None:
+		key = load_key()
+	start = time.monotonic()
+	deadline = start + timeout
+	attempts = 0
+
+	with tracing.span("ssh", f"connect {host}") as span:
+		while True:
+			remaining = deadline - time.monotonic()
+			waited = wait_for_port(host, SSH_PORT, timeout=max(0, remaining), interval=interval)
+			if log is not None and waited >= interval:
+				log(f"  Port {SSH_PORT} open after {waited:.1f}s")
+
+			attempts += 1
+			span.set(attempts=attempts)
+			ssh = paramiko.SSHClient()
+			ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+			try:
+				ssh.connect(
+					hostname=host, username=username, pkey=key,
+					timeout=10, banner_timeout=10, auth_timeout=10)
+			except FATAL_ERRORS:
+				ssh.close()
+				raise
+			except RETRY_ERRORS as e:
+				ssh.close()
+				if time.monotonic() >= deadline:
+					raise TimeoutError(
+						f"Could not connect to {host} via SSH: {e}") from e
+				if log is not None:
+					log(f"  SSH not ready yet ({e}). Retrying.")
+				time.sleep(interval)
+				continue
+
+			if log is not None:
+				log(f"  Connected via SSH after {time.monotonic() - start:.1f}s")
+			return ssh
+
+
+class _Pipeline:
+	"""
+	A sequence of steps run as one shell script on a single channel.
+	Marker lines on stdout and stderr separate the steps, so each
+	step's output, exit code and timing can be recovered while the
+	output streams in.
+	"""
+
+	def __init__(self, ssh, name, steps, stop_on_error, log):
+		self.name = name
+		self.steps = steps
+		self.log = log
+		self.marker = f"@@step-{uuid.uuid4().hex}"
+		self.results = {}
+		self._current = {"stdout": None, "stderr": None}
+		self._buffers = {"stdout": "", "stderr": ""}
+
+		script = []
+		for i, (_, cmd) in enumerate(steps):
+			script.append(f"echo '{self.marker} start {i}'; echo '{self.marker} start {i}' >&2")
+			script.append(f"( {cmd} ) < /dev/null")
+			script.append("rc=$?")
+			script.append(f"echo \"{self.marker} end {i} $rc\"; echo \"{self.marker} end {i} $rc\" >&2")
+			if stop_on_error:
+				script.append("[ $rc -eq 0 ] || exit $rc")
+
+		self.channel = ssh.get_transport().open_session()
+		self.channel.exec_command("\n".join(script))
+
+
+	def pump(self):
+		"""
+		Reads whatever output is available. Returns True if anything
+		was read.
+		"""
+		read = False
+		while self.channel.recv_ready():
+			self._feed("stdout", self.channel.recv(32768).decode(errors="replace"))
+			read = True
+		while self.channel.recv_stderr_ready():
+			self._feed("stderr", self.channel.recv_stderr(32768).decode(errors="replace"))
+			read = True
+		return read
+
+
+	@property
+	def finished(self):
+		return (self.channel.exit_status_ready()
+			and not self.channel.recv_ready()
+			and not self.channel.recv_stderr_ready())
+
+
+	def close(self):
+		for stream, rest in self._buffers.items():
+			if rest:
+				self._line(stream, rest)
+		exit_code = self.channel.recv_exit_status()
+		self.channel.close()
+
+		results = []
+		for i in sorted(self.results):
+			result = self.results[i]
+			# A step still open here was cut off, e.g. by the channel dying
+			if result["exit_code"] is None:
+				self._finish(result, exit_code)
+			result["stdout"] = "\n".join(result["stdout"])
+			result["stderr"] = "\n".join(result["stderr"])
+			results.append(result)
+		return results
+
+
+	def _feed(self, stream, data):
+		lines = (self._buffers[stream] + data).split("\n")
+		self._buffers[stream] = lines.pop()
+		for line in lines:
+			self._line(stream, line)
+
+
+	def _line(self, stream, line):
+		if line.startswith(self.marker):
+			fields = line.split()
+			i = int(fields[2])
+			if fields[1] == "start":
+				self._current[stream] = self._step(i)
+			else:
+				self._current[stream] = None
+				if stream == "stdout":
+					self._finish(self.results[i], int(fields[3]))
+			return
+
+		result = self._current[stream]
+		if result is not None:
+			result[stream].append(line)
+		if self.log is not None:
+			step = result["step"] if result else self.name
+			prefix = "!" if stream == "stderr" else " "
+			self.log(f"  [{step}]{prefix} {line}")
+
+
+	def _step(self, i):
+		if i not in self.results:
+			name, cmd = self.steps[i]
+			self.results[i] = {
+				"pipeline": self.name, "step": name, "command": cmd,
+				"exit_code": None, "elapsed": None,
+				"start": time.perf_counter(), "stdout": [], "stderr": []}
+		return self.results[i]
+
+
+	def _finish(self, result, exit_code):
+		start = result.pop("start")
+		result["exit_code"] = exit_code
+		result["elapsed"] = time.perf_counter() - start
+		tracing.record("ssh", f"{self.name}/{result['step']}", start, result["elapsed"],
+			command=result["command"], exit_code=exit_code,
+			bytes=sum(len(line) + 1 for line in result["stdout"] + result["stderr"]))
+
+
+
+def run_steps(ssh, steps, stop_on_error=True, log=print):
+	"""
+	Runs a sequence of steps in order over a single SSH channel, and
+	returns a list of results, one per step that ran, as dicts with
+	"step", "command", "exit_code", "elapsed", "stdout" and "stderr".
+
+	ssh (required) - paramiko.SSHClient
+		A connected client.
+
+	steps (required) - Array of (name, command) tuples
+		The shell commands to run, in order.
+
+	stop_on_error - boolean
+	Default: true
+		Skip the remaining steps once one exits non-zero.
+
+	log - callable, Nullable
+	Default: print
+		Called with each line of output as it arrives.
+	"""
+	return run_concurrently(ssh, {"steps": steps}, stop_on_error, log)["steps"]
+
+
+def run_concurrently(ssh, pipelines, stop_on_error=True, log=print):
+	"""
+	Runs several independent pipelines at once, each on its own channel
+	multiplexed over the same SSH connection. Output is streamed as it
+	arrives. Returns a dict of pipeline name to the list of step
+	results, as for run_steps.
+
+	pipelines (required) - dict of name to Array of (name, command)
+		The pipelines to run. Steps within a pipeline run in order.
+
+	See run_steps for the other arguments.
+	"""
+	running = [
+		_Pipeline(ssh, name, steps, stop_on_error, log)
+		for name, steps in pipelines.items()]
+	results = {}
+
+	while running:
+		read = False
+		for pipeline in list(running):
+			read = pipeline.pump() or read
+			if pipeline.finished:
+				pipeline.pump()
+				results[pipeline.name] = pipeline.close()
+				running.remove(pipeline)
+		if not read:
+			time.sleep(0.01)
+
+	return {name: results[name] for name in pipelines}
+
+
+def stop_process(ssh, executable, timeout=300, signal="TERM", log=print):
+	"""
+	Sends `signal` to every process running `executable` and blocks on
+	a single remote command until they have all exited. Returns a dict
+	with the "pids" signalled (empty if none were running), the
+	"exit_code" (124 on timeout) and the "elapsed" seconds.
+
+	ssh (required) - paramiko.SSHClient
+		A connected client.
+
+	executable (required) - string
+		The full path of the executable, as shown by `ps -ef`.
+
+	timeout - number
+	Default: 300
+		Maximum number of seconds to wait for the processes to exit.
+
+	signal - string, Nullable
+	Default: "TERM"
+		The signal to send. If None, only waits for the processes to
+		exit, e.g. after they were stopped over RCON.
+	"""
+	kill = f"kill -{signal} $pids; " if signal is not None else ""
+	script = (
+		f"pids=$(ps -ef | awk '$8==\"{executable}\" {{print $2}}'); "
+		"[ -n \"$pids\" ] || exit 0; "
+		"echo $pids; "
+		f"{kill}"
+		"for pid in $pids; do "
+		f"timeout {timeout} tail --pid=$pid -s 0.1 -f /dev/null || exit 124; "
+		"done")
+	result = run_steps(ssh, [("stop", script)], log=None)[0]
+
+	pids = [int(pid) for pid in result["stdout"].split()]
+	if log is not None:
+		if not pids:
+			log(f"  {executable} not running.")
+		elif result["exit_code"] == 0:
+			log(f"  {executable} ({', '.join(map(str, pids))}) exited after {result['elapsed']:.1f}s")
+		else:
+			log(f"  {executable} did not exit: {result['stderr'] or result['exit_code']}")
+
+	return {
+		"pids": pids,
+		"exit_code": result["exit_code"],
+		"elapsed": result["elapsed"]
+	}
@@ -1,9 +1,17 @@
+import asyncio
 import os
-import paramiko
-import time
-from pathlib import Path
 
-from digitalocean import DigitalOceanAPI
+import cloud_init
+import dns_check
+import jvm_profile
+import server_ping
+import server_setup
+import tracing
+from digitalocean import AsyncDigitalOceanAPI
+from rcon import RCON, wait_until_ready
+from reconcile import Reconciler
+from ssh import connect as connect_ssh, run_steps
+from state_cache import StateCache
 
 
 # General config
@@ -11,142 +19,183 @@ region = "sgp1"
 
 # Droplet Config
 droplet_name = "DO-MinecraftServer"
-droplet_size = "s-2vcpu-4gb"
+droplet_size = os.environ.get("DO_DROPLET_SIZE", "s-2vcpu-4gb")
 droplet_image = "ubuntu-20-04-x64"
+image_name = "DO-MinecraftServer-base"
 droplet_ssh_keys = [os.environ.get("DO_SSH_FINGERPRINT")]
 droplet_tags = ["DO-MinecraftServer"]
 
 # Network config
 domain = os.environ.get("DO_DOMAIN")
 subdomain = os.environ.get("DO_SUBDOMAIN")
+use_ipv6 = True
+srv_port = server_ping.MINECRAFT_PORT
+dns_ttl = 1800
+dns_low_ttl = 30
+dns_resolver = os.environ.get("DNS_RESOLVER", dns_check.DEFAULT_RESOLVER)
 
 # Volume config
 volume_name = "do-minecraft-server"
 
-
-# Connect to API
-access_token = os.environ.get("DO_ACCESS_TOKEN")
-api = DigitalOceanAPI(access_token)
-
-
-# Create Minecraft droplet
-print("Creating new Droplet")
-droplet = api.droplets.create(
-	name=droplet_name,
-	region=region,
-	size=droplet_size,
-	image=droplet_image,
-	ssh_keys=droplet_ssh_keys,
-	tags=droplet_tags,
-	monitoring=True)["droplet"]
-print("  Droplet created.")
-
-# Wait until droplet is created
-print("  Waiting for Droplet to start...")
-while droplet["status"] != "active":
-	time.sleep(5)
-	droplet = api.droplets.get(droplet["id"])["droplet"]
-print("  Droplet is now active!")
-
-# Get the details of the droplet once it's started so we can do networking
-droplet = api.droplets.get(droplet["id"])["droplet"]
-droplet_ip = droplet["networks"]["v4"][0]["ip_address"]
-print("  Droplet ID:", droplet["id"])
-print("  Droplet IP:", droplet_ip)
-
-
-# Reconfigure the network
-print("\nSetting up networking")
-domain_record = api.domains.list_records(
-	domain_name=domain,
-	name=f"{subdomain}.{domain}",
-	type="A")["domain_records"][0]
-
-domain_update_resp = api.domains.update_record(
-	domain_name=domain,
-	domain_record_id=domain_record["id"],
-	type="A",
-	data=droplet_ip)
-
-print(f"Domain Record added for {subdomain}.{domain}")
-
-
-# Attach the volume
-print("\nAttaching Volume")
-api.volumes.attach_by_name(
-	volume_name=volume_name,
-	droplet_id=droplet["id"],
-	region=region)
-print("Volume attached!")
-
-
-# Set up SSH connection
-print("\nRunning setup commands")
-
-print("  Waiting a little bit before we try connect via SSH")
-time.sleep(10)
-
-print("  Connecting to server via SSH")
-key_path = Path(os.environ.get("DO_SSH_KEY")).expanduser()
-with open(key_path, "r") as stream:
-	k = paramiko.RSAKey.from_private_key(stream)
-
-while True:
-	try:
-		ssh = paramiko.SSHClient()
-		ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-		ssh.connect(hostname=droplet_ip, username="root", pkey=k)
-	except:
-		print("  Failed to connect via SSH. Trying again in 10 seconds.")
-		time.sleep(10)
-		continue
-	break
-
-# Run command to mount volume
-print("  Mounting Volume")
-cmd = f"mkdir -p /mnt/mc && mount -o discard,defaults,noatime /dev/disk/by-id/scsi-0DO_Volume_{volume_name} /mnt/mc"
-stdin, stdout, stderr = ssh.exec_command(cmd)
-for line in stderr:
-	print(line)
-
-# # Create swap space
-# print("  Setting up swapfile")
-# cmd = f"""
-# sudo fallocate -l 4G /swapfile
-# 	&& sudo chmod 600 /swapfile
-# 	&& sudo mkswap /swapfile
-# 	&& sudo swapon /swapfile
-# 	&& sudo sysctl vm.swappiness=10""".replace("\n"," ")
-# stdin, stdout, stderr = ssh.exec_command(cmd)
-# for line in stderr:
-# 	print(line)
-
-# Start Minecraft server!
-print("  Starting Minecraft Server in background")
-cmd = "nohup /mnt/mc/start.sh 2>&1 > ~/minecraftserver.log &"
-stdin, stdout, stderr = ssh.exec_command(cmd)
-
-# Run command to open firewall for Minecraft server
-print("  Opening port 22 and 25565")
-cmd = f"""
-ufw allow OpenSSH
-	&& ufw allow 25565/tcp
-	&& ufw allow 25565/udp""".replace("\n", " ")
-stdin, stdout, stderr = ssh.exec_command(cmd)
-for line in stderr:
-	print(line)
-
-# Run command to enable firewall
-print("  Enabling UFW firewall")
-cmd = f"yes | ufw enable"
-stdin, stdout, stderr = ssh.exec_command(cmd)
-for line in stderr:
-	print(line)
-
-# Close SSH connection. We are done!
-print("  Disconnecting from SSH")
-ssh.close()
-del stdin
-
-
-print("\nDone!")
+# Server config
+rcon_password = os.environ.get("DO_RCON_PASSWORD")
+swap_size = None
+verify_over_ssh = True
+trace_path = "start_server.trace.json"
+
+
+def start(async_api, cache=None):
+	"""
+	Brings up the droplet, DNS records and volume, sets up or checks on
+	the server over SSH, and waits until players can connect by name.
+	Returns the reconciled state.
+
+	async_api (required) - AsyncDigitalOceanAPI
+		The client to reconcile through. It is left open.
+
+	cache - StateCache, Nullable
+		Cache of resource IDs to consult before listing.
+	"""
+	# Desired state of the server stack. Anything that already exists and
+	# matches is left alone, so re-running this is cheap.
+	spec = {
+		"droplet": {
+			"name": droplet_name,
+			"region": region,
+			"size": droplet_size,
+			"image": droplet_image,
+			"image_name": image_name,
+			"user_data": None,
+			"ssh_keys": droplet_ssh_keys,
+			"tags": droplet_tags,
+			"ipv6": use_ipv6
+		},
+		"volume": {
+			"name": volume_name
+		},
+		"dns": {
+			"domain": domain,
+			"name": subdomain,
+			"type": "A",
+			"ipv6": use_ipv6,
+			"srv_port": srv_port,
+			"ttl": dns_ttl,
+			"low_ttl": dns_low_ttl
+		}
+	}
+
+	# Bring up the droplet, DNS records and volume
+	print("Reconciling Droplet, DNS and Volume")
+	reconciler = Reconciler(async_api, spec, cache=cache)
+	with tracing.phase("reconcile"):
+		if asyncio.run(reconciler.observe())["droplet"] is None:
+			# A new droplet is set up by cloud-init, with the JVM sized for
+			# it. An existing one is not resized, so it gets a profile for
+			# its own size below, without looking the size up.
+			size = async_api.sync.sizes.find_by_slug(droplet_size)
+			if size is None:
+				raise LookupError(f"Droplet size {droplet_size} not found")
+			spec["droplet"]["user_data"] = cloud_init.server_user_data(
+				volume_name, swap_size=swap_size, start_script=jvm_profile.for_size(size))
+		state = asyncio.run(reconciler.run())
+
+	droplet = state["droplet"]
+	droplet_ip = state["droplet_ip"]
+	from_image = state["from_image"]
+	print("  Droplet ID:", droplet["id"])
+	print("  Droplet IP:", droplet_ip)
+	print(f"  {subdomain}.{domain} -> {state['record']['data']}")
+
+	# Size the JVM to the droplet that is actually running
+	start_script = jvm_profile.for_size(droplet)
+	print(f"  Droplet size: {droplet['size_slug']}, {droplet['memory']} MiB, {droplet['vcpus']} vCPUs,"
+		f" {jvm_profile.heap_size(droplet['memory'])} MiB heap")
+
+	# The droplet sets itself up on boot, so SSH is only used to check on
+	# it, and to wait for the world to load over RCON. A stock droplet
+	# resumed from standby is the exception: cloud-init only ran on its
+	# first boot, so the volume has to be mounted and the server started
+	# over SSH either way.
+	resumed_stock = state["powered_on"] and not from_image
+	if verify_over_ssh or resumed_stock:
+		print("\nVerifying setup" if verify_over_ssh else "\nStarting server")
+		print("  Connecting to server via SSH")
+		with tracing.phase("connect ssh"):
+			ssh = connect_ssh(droplet_ip)
+
+		if resumed_stock:
+			with tracing.phase("boot setup"):
+				results = run_steps(ssh,
+					server_setup.mount_steps(volume_name)
+					+ server_setup.start_script_steps(start_script)
+					+ server_setup.start_steps(), log=None)
+			for step in results:
+				status = "ok" if step["exit_code"] == 0 else f"exit code {step['exit_code']}"
+				print(f"  {step['step']}: {status} ({step['elapsed']:.1f}s)")
+		elif not from_image:
+			# Wait for the cloud-init pipelines and check they succeeded
+			with tracing.phase("boot setup"):
+				results = run_steps(ssh, cloud_init.verify_steps(), stop_on_error=False, log=None)
+			for step in results:
+				status = "ok" if step["exit_code"] == 0 else f"exit code {step['exit_code']}"
+				print(f"  {step['step']}: {status} ({step['elapsed']:.1f}s)")
+				if step["exit_code"] != 0 and step["stdout"]:
+					print("\n".join(f"    {line}" for line in step["stdout"].split("\n")))
+		else:
+			# The image mounts the volume and starts the server by itself.
+			# The start script is only rewritten, and the server restarted,
+			# if the droplet size has changed.
+			with tracing.phase("boot setup"):
+				results = run_steps(ssh, server_setup.start_script_steps(start_script, restart=True), log=None)
+			for step in results:
+				status = "ok" if step["exit_code"] == 0 else f"exit code {step['exit_code']}"
+				print(f"  {step['step']}: {status} ({step['elapsed']:.1f}s)")
+
+		# Wait for the world to finish loading. RCON only accepts logins
+		# once the server is "Done", and is reached through the SSH
+		# connection.
+		if verify_over_ssh and rcon_password:
+			print("  Waiting for Minecraft Server to finish loading")
+			with tracing.phase("world load"):
+				rcon, _ = wait_until_ready(lambda: RCON.over_ssh(ssh, rcon_password))
+			players = rcon.players()
+			print(f"  Players online: {players['online']}/{players['max']}")
+			rcon.close()
+
+		# Close SSH connection
+		print("  Disconnecting from SSH")
+		ssh.close()
+
+	# The server is only done once the game port answers a status ping
+	print("\nWaiting for Minecraft Server to answer on port 25565")
+	with tracing.phase("game port"):
+		server_ping.wait_until_ready(droplet_ip)
+
+	# Players connect by name, so only announce the server once the name
+	# resolves to it
+	print(f"\nWaiting for {dns_resolver} to serve {subdomain}.{domain} -> {droplet_ip}")
+	with tracing.phase("dns propagation"):
+		dns_check.wait_for_record(f"{subdomain}.{domain}", droplet_ip,
+			resolver=dns_resolver, since=state.get("record_changed_at"))
+
+	return state
+
+
+def main():
+	# Time every phase, API request and SSH command
+	tracer = tracing.enable()
+
+	async_api = AsyncDigitalOceanAPI(os.environ.get("DO_ACCESS_TOKEN"))
+	start(async_api, cache=StateCache())
+	async_api.close()
+
+	# Where the time went
+	tracer.write(trace_path)
+	print(f"\nTiming (full trace in {trace_path})")
+	print(tracer.summary())
+
+	print("\nDone!")
+
+
+if __name__ == "__main__":
+	main()
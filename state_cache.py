@@ -0,0 +1,98 @@
+"""
+Persistent on-disk cache of resource IDs, so lookups that always give
+the same answer (the DNS record ID, the volume ID, the droplet we made)
+don't cost a list call on every run.
+
+Entries are grouped by kind ("droplet", "volume", "record") and keyed
+by name and region, and expire after a TTL. Callers should invalidate
+an entry when the API answers 404 for its ID.
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+
+DEFAULT_PATH = "~/.cache/do-minecraftserver/state.json"
+
+# Seconds each kind of entry stays fresh for
+DEFAULT_TTLS = {
+	"droplet": 24 * 60 * 60,
+	"volume": 7 * 24 * 60 * 60,
+	"record": 7 * 24 * 60 * 60
+}
+
+
+def is_not_found(resp):
+	"""
+	Returns True if an API response is a 404 error body.
+	"""
+	return isinstance(resp, dict) and resp.get("id") == "not_found"
+
+
+
+class StateCache:
+
+	def __init__(self, path=None, ttls=None):
+		"""
+		path - string
+		Default: DEFAULT_PATH
+			The JSON file to keep the cache in.
+
+		ttls - dict, Nullable
+			Overrides for DEFAULT_TTLS, by kind.
+		"""
+		self.path = Path(path if path is not None else DEFAULT_PATH).expanduser()
+		self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+		self._entries = self._load()
+
+
+	def _load(self):
+		try:
+			with open(self.path, "r") as stream:
+				return json.load(stream)
+		except (OSError, ValueError):
+			return {}
+
+
+	def save(self):
+		"""
+		Writes the cache to disk, replacing the file atomically.
+		"""
+		self.path.parent.mkdir(parents=True, exist_ok=True)
+		tmp_path = self.path.with_suffix(".tmp")
+		with open(tmp_path, "w") as stream:
+			json.dump(self._entries, stream, indent=2, sort_keys=True)
+		os.replace(tmp_path, self.path)
+
+
+	def get(self, kind, key):
+		"""
+		Returns the cached value, or None if missing or expired.
+		"""
+		entry = self._entries.get(kind, {}).get(key)
+		if entry is None:
+			return None
+		if time.time() - entry["stored_at"] > self.ttls.get(kind, 0):
+			self.invalidate(kind, key)
+			return None
+		return entry["value"]
+
+
+	def set(self, kind, key, value):
+		"""
+		Stores `value` (anything JSON serialisable) and saves the cache.
+		"""
+		self._entries.setdefault(kind, {})[key] = {
+			"value": value,
+			"stored_at": time.time()
+		}
+		self.save()
+
+
+	def invalidate(self, kind, key):
+		"""
+		Drops an entry, e.g. after the API returned 404 for it.
+		"""
+		if self._entries.get(kind, {}).pop(key, None) is not None:
+			self.save()
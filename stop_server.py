@@ -1,10 +1,16 @@
+import asyncio
 import os
-import paramiko
 import sys
-import time
-from pathlib import Path
+from paramiko import SSHException
 
-from digitalocean import DigitalOceanAPI
+import server_ping
+import server_setup
+import tracing
+from digitalocean import APIError, AsyncDigitalOceanAPI
+from rcon import RCON, RCONError
+from reconcile import Reconciler, public_ip
+from ssh import connect as connect_ssh, stop_process
+from state_cache import StateCache
 
 # General config
 region = "sgp1"
@@ -13,91 +19,148 @@ region = "sgp1"
 droplet_name = "DO-MinecraftServer"
 droplet_tags = ["DO-MinecraftServer"]
 
-# Volume config
-volume_name = "do-minecraft-server"
+# Power the droplet off instead of deleting it. It keeps its IP and
+# volume, and the next start only has to power it on, but it is still
+# billed while off.
+standby = False
 
+# Network config
+domain = os.environ.get("DO_DOMAIN")
+subdomain = os.environ.get("DO_SUBDOMAIN")
+use_ipv6 = True
+srv_port = server_ping.MINECRAFT_PORT
+dns_low_ttl = 30
 
-# Connect to API
-access_token = os.environ.get("DO_ACCESS_TOKEN")
-api = DigitalOceanAPI(access_token)
+# Volume config
+volume_name = "do-minecraft-server"
 
+# Server config
+rcon_password = os.environ.get("DO_RCON_PASSWORD")
+trace_path = "stop_server.trace.json"
+
+
+def stop(async_api, cache=None):
+	"""
+	Stops the Minecraft server, then deletes the droplet (or powers it
+	off, in standby). Returns the exit code for the script: 0 if it is
+	stopped or there was nothing to stop, 1 if it is left running.
+
+	async_api (required) - AsyncDigitalOceanAPI
+		The client to reconcile through. It is left open.
+
+	cache - StateCache, Nullable
+		Cache of resource IDs to consult before listing.
+	"""
+	# Desired state: no droplet, and the volume detached from it. The
+	# DNS records get a low TTL, as the next droplet will have a new IP.
+	# In standby, the droplet is only powered off.
+	spec = {
+		"droplet": {
+			"present": False,
+			"standby": standby,
+			"name": droplet_name,
+			"region": region,
+			"tags": droplet_tags
+		},
+		"volume": {
+			"name": volume_name
+		},
+		"dns": {
+			"domain": domain,
+			"name": subdomain,
+			"type": "A",
+			"ipv6": use_ipv6,
+			"srv_port": srv_port,
+			"low_ttl": dns_low_ttl
+		}
+	}
+	reconciler = Reconciler(async_api, spec, cache=cache)
+
+	# Find the correct Minecraft droplet, by matching tag and region
+	print("Getting ID of Droplet")
+	droplet = asyncio.run(reconciler.observe())["droplet"]
+
+	# If there is no droplet, there is nothing to stop. We can stop here!
+	if droplet is None:
+		print("No droplet found. Nothing to do")
+		return 0
+
+	droplet_ip = public_ip(droplet)
+	print("  Droplet ID:", droplet["id"])
+	print("  Droplet IP:", droplet_ip)
+
+	# A powered off droplet has no server running to stop. In standby
+	# that is all we want, otherwise it only needs tearing down.
+	if droplet["status"] == "off" and standby:
+		print("Droplet is already off. Nothing to do")
+		return 0
+
+	if droplet["status"] == "off":
+		print("\nDroplet is off, so the server is not running")
+	else:
+		# Shut down minecraft server
+		print("\nShutting down Minecraft server")
+		print("  Connecting to server via SSH")
+		with tracing.phase("connect ssh"):
+			ssh = connect_ssh(droplet_ip)
+
+		try:
+			# Flush the world and stop the server over RCON if we can,
+			# otherwise fall back to a SIGTERM
+			stop_signal = "TERM"
+			if rcon_password:
+				try:
+					with tracing.phase("rcon shutdown"), RCON.over_ssh(ssh, rcon_password) as rcon:
+						print(f"  Players online: {rcon.players()['online']}")
+						print("  Saving world and stopping server via RCON")
+						rcon.shutdown()
+					stop_signal = None
+				except (RCONError, OSError, SSHException) as e:
+					print(f"  Could not stop server via RCON ({e}). Sending SIGTERM instead.")
+
+			# Block until the JVM has exited
+			print("  Waiting until server has exited")
+			with tracing.phase("server exit"):
+				stop_result = stop_process(ssh, server_setup.JAVA, signal=stop_signal)
+		finally:
+			ssh.close()
+		if stop_result["exit_code"] != 0:
+			print("  Server did not stop cleanly. Not deleting the Droplet.")
+			return 1
+
+	# Lower the DNS TTL, detach the volume and delete the droplet
+	if standby:
+		print("\nPowering off Droplet")
+	else:
+		print("\nLowering DNS TTL, detaching Volume and deleting Droplet")
+	try:
+		with tracing.phase("teardown"):
+			asyncio.run(reconciler.run())
+	except (RuntimeError, TimeoutError, APIError) as e:
+		print(f"  Failed: {e}")
+		return 1
+	return 0
 
-# Find the correct Minecraft droplet
-print("Getting ID of Droplet")
-droplets = api.droplets.list(tag_name=droplet_tags[0])["droplets"]
-droplet_id = None
 
-# Look for the right droplet by matching tag and region
-for droplet in droplets:
-	if droplet["name"] == droplet_name and droplet["region"]["slug"] == region:
-		droplet_id = droplet["id"]
-		break
+def main():
+	# Time every phase, API request and SSH command
+	tracer = tracing.enable()
 
-# If the ID is None, there is no droplet to delete. We can stop here!
-if droplet_id is None:
-	print("No droplet found. Exiting")
-	sys.exit(1)
+	async_api = AsyncDigitalOceanAPI(os.environ.get("DO_ACCESS_TOKEN"))
+	try:
+		code = stop(async_api, cache=StateCache())
+	finally:
+		async_api.close()
 
-droplet_ip = droplet["networks"]["v4"][0]["ip_address"]
-print("  Droplet ID:", droplet["id"])
-print("  Droplet IP:", droplet_ip)
+		# Where the time went, whether or not it worked
+		tracer.write(trace_path)
+		print(f"\nTiming (full trace in {trace_path})")
+		print(tracer.summary())
 
+	if code != 0:
+		sys.exit(code)
+	print("\nDone!")
 
-# Shut down minecraft server
-print("\nShutting down Minecraft server")
-print("  Connecting to server via SSH")
-key_path = Path(os.environ.get("DO_SSH_KEY")).expanduser()
-with open(key_path, "r") as stream:
-	k = paramiko.RSAKey.from_private_key(stream)
 
-while True:
-	try:
-		ssh = paramiko.SSHClient()
-		ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-		ssh.connect(hostname=droplet_ip, username="root", pkey=k)
-	except:
-		print("  Failed to connect via SSH. Trying again in 10 seconds.")
-		time.sleep(10)
-		continue
-	break
-
-# Run command to get PID of minecraft server
-print("  Getting PID of process")
-cmd = """ps -ef | awk '$8=="/mnt/mc/jdk/bin/java" {print $2}'"""
-stdin, stdout, stderr = ssh.exec_command(cmd)
-pid = stdout.read().decode().strip()
-
-if pid != "":
-	# Send a SIGTERM to server
-	print("  Sending SIGTERM to process")
-	cmd = f"kill -15 {pid}"
-	stdin, stdout, stderr = ssh.exec_command(cmd)
-	for line in stderr:
-		print(line)
-
-	# Ensure the server has stopped
-	print("  Waiting until server has stopped")
-	while pid != "":
-		time.sleep(3)
-		get_pid_cmd = """ps -ef | awk '$8=="/mnt/mc/jdk/bin/java" {print $2}'"""
-		stdin, stdout, stderr = ssh.exec_command(get_pid_cmd)
-		pid = stdout.read().decode().strip()
-else:
-	print("  Server not running.")
-
-
-# Unmount volume
-print("\nDetaching volume")
-api.volumes.attach_by_name(
-	volume_name=volume_name,
-	droplet_id=droplet_id,
-	region=region)
-print("  Volume detached")
-
-
-# Delete the droplet!
-print("\nDeleting Droplet")
-api.droplets.delete(droplet_id)
-print("  Droplet Deleted")
-
-print("\nDone!")
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,82 @@
+import socket
+import struct
+import threading
+
+import pytest
+
+from dns_check import StubResolver, query, wait_for_record
+
+
+RECORDS = {
+	("mc.example.com", "A"): ["203.0.113.5"],
+	("mc.example.com", "AAAA"): ["2001:db8::5"]
+}
+
+
+def test_a_and_aaaa():
+	with StubResolver(RECORDS, ttl=30) as resolver:
+		assert query("mc.example.com", "A", "127.0.0.1", resolver.port) == [("203.0.113.5", 30)]
+		assert query("mc.example.com.", "AAAA", "127.0.0.1", resolver.port) == [("2001:db8::5", 30)]
+
+
+def test_several_answers():
+	with StubResolver({("mc.example.com", "A"): ["203.0.113.5", "203.0.113.6"]}) as resolver:
+		answers = query("mc.example.com", "A", "127.0.0.1", resolver.port)
+		assert [data for data, _ in answers] == ["203.0.113.5", "203.0.113.6"]
+
+
+def test_nxdomain():
+	with StubResolver(RECORDS) as resolver:
+		assert query("other.example.com", "A", "127.0.0.1", resolver.port) == []
+
+
+def test_late_answer_is_skipped():
+	# A resolver that first sends an answer to some earlier query, then
+	# the answer to this one
+	stub = StubResolver(RECORDS)
+	stub.close()
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	sock.bind(("127.0.0.1", 0))
+
+	def serve():
+		data, address = sock.recvfrom(512)
+		answer = stub._answer(data)
+		query_id, = struct.unpack(">H", answer[:2])
+		sock.sendto(struct.pack(">H", (query_id + 1) % (1 << 16)) + answer[2:], address)
+		sock.sendto(answer, address)
+
+	thread = threading.Thread(target=serve, daemon=True)
+	thread.start()
+	try:
+		assert query("mc.example.com", "A", "127.0.0.1", sock.getsockname()[1]) == [("203.0.113.5", 30)]
+	finally:
+		thread.join(5)
+		sock.close()
+
+
+def test_no_answer_times_out():
+	with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+		sock.bind(("127.0.0.1", 0))
+		with pytest.raises(OSError):
+			query("mc.example.com", "A", "127.0.0.1", sock.getsockname()[1], timeout=0.2)
+
+
+def test_wait_for_record_after_change():
+	with StubResolver({("mc.example.com", "A"): ["203.0.113.1"]}) as resolver:
+		timer = threading.Timer(0.3, resolver.records.update, [{("mc.example.com", "A"): ["203.0.113.5"]}])
+		timer.start()
+		try:
+			result = wait_for_record("mc.example.com", "203.0.113.5", resolver="127.0.0.1",
+				port=resolver.port, timeout=5, interval=0.1, log=None)
+		finally:
+			timer.cancel()
+		assert result["polls"] > 1
+		assert result["ttl"] == 30
+		assert result["latency"] is None
+
+
+def test_wait_for_record_timeout():
+	with StubResolver(RECORDS) as resolver:
+		with pytest.raises(TimeoutError):
+			wait_for_record("mc.example.com", "203.0.113.9", resolver="127.0.0.1",
+				port=resolver.port, timeout=0.3, interval=0.1, log=None)
@@ -0,0 +1,88 @@
+import json
+import random
+
+import pytest
+
+from json_stream import iter_items
+
+
+PAGE = {
+	"droplets": [
+		{"id": 1, "name": "DO-MinecraftServer", "memory": 4096, "price": 0.02976, "big": 12345678901234567890},
+		{"id": 2, "name": "café ☃ \U0001f600", "tags": [], "nested": {"a": [1, 2.5e-3, None, True]}},
+		{"id": 3, "name": "escaped \"quotes\" and \\ and ]}", "ratio": -1e10}
+	],
+	"links": {"pages": {"next": "https://api.digitalocean.com/v2/droplets?page=2&per_page=3"}},
+	"meta": {"total": 7}
+}
+
+
+def split(data, sizes):
+	chunks = []
+	while data:
+		size = next(sizes)
+		chunks.append(data[:size])
+		data = data[size:]
+	return chunks
+
+
+def read(chunks, key="droplets"):
+	items = []
+	gen = iter_items(chunks, key)
+	while True:
+		try:
+			items.append(next(gen))
+		except StopIteration as stop:
+			return items, stop.value
+
+
+@pytest.mark.parametrize("indent", [None, "\t"])
+def test_random_chunk_splits(indent):
+	data = json.dumps(PAGE, indent=indent, ensure_ascii=False).encode("utf-8")
+	rng = random.Random(1)
+	for _ in range(200):
+		chunks = split(data, iter(lambda: rng.randint(1, 16), None))
+		items, rest = read(chunks)
+		assert items == PAGE["droplets"]
+		assert rest == {"links": PAGE["links"], "meta": PAGE["meta"]}
+
+
+def test_one_byte_chunks():
+	data = json.dumps(PAGE, ensure_ascii=False).encode("utf-8")
+	items, rest = read([data[i:i + 1] for i in range(len(data))])
+	assert items == PAGE["droplets"]
+	assert rest["meta"] == {"total": 7}
+
+
+def test_numbers_at_chunk_ends():
+	# Each number is cut off at the end of a chunk
+	items, rest = read([b'{"items": [12', b'3, 1e', b'-5, -0.', b'25], "n": 4', b'2}'], "items")
+	assert items == [123, 1e-5, -0.25]
+	assert rest == {"n": 42}
+
+
+def test_empty_list():
+	items, rest = read([b'{"droplets": [ ], "links": {}, "meta": {"total": 0}}'])
+	assert items == []
+	assert rest == {"links": {}, "meta": {"total": 0}}
+
+
+def test_empty_object():
+	assert read([b"{}"]) == ([], {})
+
+
+def test_stop_early():
+	gen = iter_items([json.dumps(PAGE).encode("utf-8")], "droplets")
+	assert next(gen)["id"] == 1
+	gen.close()
+
+
+@pytest.mark.parametrize("data", [
+	b'[1, 2]',
+	b'{"droplets": {"id": 1}}',
+	b'{"droplets": [1, 2',
+	b'{"droplets": [1 2]}'
+])
+def test_invalid(data):
+	with pytest.raises(json.JSONDecodeError):
+		read([data])
@@ -0,0 +1,61 @@
+import socket
+
+import pytest
+
+from rcon import RCON, RCONError, FakeRCONServer, SERVERDATA_AUTH, SERVERDATA_EXECCOMMAND, _encode, _read_packet
+
+
+def test_login_and_command():
+	with FakeRCONServer(password="secret") as server:
+		with RCON("127.0.0.1", server.port, "secret") as rcon:
+			assert rcon.command("say hello") == "say hello"
+		assert server.commands == ["say hello"]
+
+
+def test_wrong_password():
+	with FakeRCONServer(password="secret") as server:
+		with pytest.raises(RCONError):
+			RCON("127.0.0.1", server.port, "wrong")
+
+
+def test_multi_packet_response():
+	with FakeRCONServer(password="secret", max_packet=100) as server:
+		with RCON("127.0.0.1", server.port, "secret") as rcon:
+			text = "".join(str(i % 10) for i in range(1000))
+			assert rcon.command(text) == text
+			# The connection is still in step afterwards
+			assert rcon.command("again") == "again"
+
+
+def test_players():
+	with FakeRCONServer(password="secret", players=["alice", "bob"], max_players=10) as server:
+		with RCON("127.0.0.1", server.port, "secret") as rcon:
+			assert rcon.players() == {"online": 2, "max": 10, "names": ["alice", "bob"]}
+
+
+def test_players_empty():
+	with FakeRCONServer(password="secret") as server:
+		with RCON("127.0.0.1", server.port, "secret") as rcon:
+			assert rcon.players() == {"online": 0, "max": 20, "names": []}
+
+
+def test_shutdown():
+	with FakeRCONServer(password="secret") as server:
+		with RCON("127.0.0.1", server.port, "secret") as rcon:
+			rcon.shutdown()
+		assert server.stopped.wait(5)
+		assert server.commands == ["save-off", "save-all flush", "stop"]
+
+
+def test_server_drops_pipelined_packets():
+	# The client must never send two packets at once, as the server
+	# reads each one with a single read
+	with FakeRCONServer(password="secret") as server:
+		with socket.create_connection(("127.0.0.1", server.port), timeout=5) as sock:
+			sock.sendall(_encode(1, SERVERDATA_AUTH, "secret"))
+			assert _read_packet(sock)[0] == 0
+			assert _read_packet(sock)[:2] == (1, SERVERDATA_EXECCOMMAND)
+
+			sock.sendall(_encode(2, SERVERDATA_EXECCOMMAND, "list") + _encode(3, SERVERDATA_EXECCOMMAND, "list"))
+			with pytest.raises(RCONError):
+				_read_packet(sock)
@@ -0,0 +1,62 @@
+import json
+import socket
+import threading
+
+import pytest
+
+from server_ping import PingError, _packet, _read_packet, _unpack_varint, _varint, ping
+
+
+@pytest.mark.parametrize("value, encoded", [
+	(0, b"\x00"),
+	(1, b"\x01"),
+	(127, b"\x7f"),
+	(128, b"\x80\x01"),
+	(255, b"\xff\x01"),
+	(25565, b"\xdd\xc7\x01"),
+	(2097151, b"\xff\xff\x7f"),
+	(2147483647, b"\xff\xff\xff\xff\x07"),
+	(-1, b"\xff\xff\xff\xff\x0f")
+])
+def test_varint(value, encoded):
+	assert _varint(value) == encoded
+	assert _unpack_varint(b"\x00" + encoded + b"\x00", 1) == (value & 0xFFFFFFFF, 1 + len(encoded))
+
+
+def test_varint_truncated():
+	with pytest.raises(PingError):
+		_unpack_varint(b"\x80\x80")
+
+
+def test_varint_too_long():
+	with pytest.raises(PingError):
+		_unpack_varint(b"\x80\x80\x80\x80\x80\x01")
+
+
+def test_ping():
+	status = {"version": {"name": "1.18.1", "protocol": 757}, "players": {"max": 20, "online": 3},
+		"description": {"text": "A Minecraft Server"}}
+
+	with socket.socket() as server:
+		server.bind(("127.0.0.1", 0))
+		server.listen()
+
+		def serve():
+			conn, _ = server.accept()
+			with conn:
+				assert _read_packet(conn)[0] == 0x00  # Handshake
+				assert _read_packet(conn) == (0x00, b"")  # Status request
+				body = json.dumps(status).encode("utf-8")
+				conn.sendall(_packet(0x00, _varint(len(body)) + body))
+				packet_id, payload = _read_packet(conn)
+				conn.sendall(_packet(packet_id, payload))
+
+		thread = threading.Thread(target=serve, daemon=True)
+		thread.start()
+		result = ping("127.0.0.1", server.getsockname()[1], timeout=5)
+		thread.join(5)
+
+	assert result["online"] == 3
+	assert result["max"] == 20
+	assert result["version"] == "1.18.1"
+	assert result["status"] == status
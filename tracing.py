@@ -0,0 +1,227 @@
+"""
+Lightweight tracing for the start and stop workflows.
+
+Phases are named sections of a workflow ("create droplet", "wait for
+SSH", ...), and spans are the individual operations inside them: every
+DigitalOceanAPI request and every SSH command. Both nest under whatever
+phase is current, including across threads and asyncio tasks that are
+started from inside it.
+
+tracer = tracing.enable()
+with tracing.phase("reconcile"):
+	...
+tracer.write("start_server.trace.json")
+print(tracer.summary())
+
+Tracing is off until enable() is called, and while off, phase and span
+return a shared no-op object, so instrumented code costs next to
+nothing.
+"""
+import contextvars
+import json
+import time
+
+
+_tracer = None
+_current = contextvars.ContextVar("trace_current", default=None)
+
+
+
+class Span:
+
+	__slots__ = ("kind", "name", "start", "duration", "attrs", "children", "_token")
+
+	def __init__(self, kind, name, attrs):
+		self.kind = kind
+		self.name = name
+		self.start = None
+		self.duration = None
+		self.attrs = attrs
+		self.children = []
+		self._token = None
+
+
+	def set(self, **attrs):
+		"""
+		Adds attributes, e.g. the status of a response once it arrives.
+		"""
+		self.attrs.update(attrs)
+
+
+	def __enter__(self):
+		parent = _current.get() or _tracer.root
+		parent.children.append(self)
+		self.start = time.perf_counter()
+		self._token = _current.set(self)
+		return self
+
+
+	def __exit__(self, exc_type, exc, tb):
+		self.duration = time.perf_counter() - self.start
+		if exc_type is not None:
+			self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+		_current.reset(self._token)
+
+
+	def to_dict(self, origin):
+		return {
+			"kind": self.kind,
+			"name": self.name,
+			"start": round(self.start - origin, 6),
+			"duration": round(self.duration, 6) if self.duration is not None else None,
+			"attrs": self.attrs,
+			"children": [child.to_dict(origin) for child in self.children]
+		}
+
+
+
+class _NoopSpan:
+
+	__slots__ = ()
+
+	def set(self, **attrs):
+		pass
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, exc_type, exc, tb):
+		pass
+
+
+_NOOP = _NoopSpan()
+
+
+
+class Tracer:
+
+	def __init__(self):
+		self.root = Span("root", "total", {})
+		self.root.start = time.perf_counter()
+		self.started_at = time.time()
+
+
+	def finish(self):
+		if self.root.duration is None:
+			self.root.duration = time.perf_counter() - self.root.start
+
+
+	def to_dict(self):
+		self.finish()
+		return {
+			"started_at": self.started_at,
+			"trace": self.root.to_dict(self.root.start)
+		}
+
+
+	def write(self, path):
+		"""
+		Writes the trace as JSON.
+		"""
+		with open(path, "w") as stream:
+			json.dump(self.to_dict(), stream, indent=2)
+
+
+	def summary(self):
+		"""
+		Returns a table of each phase's wall time, with the API requests
+		and SSH commands made inside it (including nested phases).
+		"""
+		self.finish()
+		header = (f"{'phase':<32} {'wall s':>8} {'api':>5} {'api s':>8} {'retry':>5}"
+			f" {'KiB':>8} {'ssh':>5} {'ssh s':>8}")
+		lines = [header, "-" * len(header)]
+		self._summarise(self.root, 0, lines)
+		return "\n".join(lines)
+
+
+	def _summarise(self, span, depth, lines):
+		totals = _totals(span)
+		lines.append(
+			f"{'  ' * depth + span.name:<32.32} {span.duration or 0:>8.2f}"
+			f" {totals['http']:>5} {totals['http_seconds']:>8.2f} {totals['retries']:>5}"
+			f" {totals['bytes'] / 1024:>8.1f}"
+			f" {totals['ssh']:>5} {totals['ssh_seconds']:>8.2f}")
+		for child in span.children:
+			if child.kind == "phase":
+				self._summarise(child, depth + 1, lines)
+
+
+
+def _totals(span):
+	totals = {"http": 0, "http_seconds": 0.0, "retries": 0, "bytes": 0, "ssh": 0, "ssh_seconds": 0.0}
+	stack = list(span.children)
+	while stack:
+		child = stack.pop()
+		stack.extend(child.children)
+		if child.kind == "http":
+			totals["http"] += 1
+			totals["http_seconds"] += child.duration or 0
+			totals["retries"] += child.attrs.get("retries", 0)
+			totals["bytes"] += child.attrs.get("bytes") or 0
+		elif child.kind == "ssh":
+			totals["ssh"] += 1
+			totals["ssh_seconds"] += child.duration or 0
+	return totals
+
+
+def enable():
+	"""
+	Starts a new trace and returns its Tracer.
+	"""
+	global _tracer
+	_tracer = Tracer()
+	return _tracer
+
+
+def disable():
+	global _tracer
+	_tracer = None
+
+
+def phase(name, **attrs):
+	"""
+	Context manager marking a named phase of a workflow.
+	"""
+	if _tracer is None:
+		return _NOOP
+	return Span("phase", name, attrs)
+
+
+def span(kind, name, **attrs):
+	"""
+	Context manager timing a single operation, e.g. kind "http" and name
+	"GET /v2/droplets". Yields the span, so attributes can be added with
+	set() once known.
+	"""
+	if _tracer is None:
+		return _NOOP
+	return Span(kind, name, attrs)
+
+
+def record(kind, name, start, duration, **attrs):
+	"""
+	Adds a span for an operation that has already happened, such as an
+	SSH step whose timing was read from its output. `start` is a
+	time.perf_counter() value.
+	"""
+	if _tracer is None:
+		return
+	new = Span(kind, name, attrs)
+	new.start = start
+	new.duration = duration
+	(_current.get() or _tracer.root).children.append(new)
+
+
+def bind(func):
+	"""
+	Wraps `func` to run in the current trace context, for handing work
+	to another thread.
+	"""
+	if _tracer is None:
+		return func
+	context = contextvars.copy_context()
+	# A context can only be entered by one thread at a time
+	return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)